@@ -1,11 +1,15 @@
 """API route definitions"""
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, UploadFile, File, Query, Form, Request
-from fastapi.responses import FileResponse, StreamingResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, WebSocket, WebSocketDisconnect, UploadFile, File, Query, Form, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse, Response
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session, joinedload, selectinload
 from typing import List, Optional, Union
 from pydantic import BaseModel
 import uuid
 import json
+import hashlib
+import stat
 from pathlib import Path
 from datetime import datetime
 import zipfile
@@ -32,6 +36,8 @@ from backend.services.external_broker_service import (
 from backend.services.training_service import training_service
 from backend.utils.yolo_export import YOLOExporter
 from backend.utils.dataset_import import DatasetImporter, generate_color
+from backend.utils.zip_stream import stream_zip
+from backend.utils.json_utils import json_loads, json_dumps_bytes
 from backend.config import settings
 from PIL import Image as PILImage
 import io
@@ -42,6 +48,55 @@ import tempfile
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Chunk size used when streaming uploaded files to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Image file extensions accepted for upload and dataset import
+ALLOWED_IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp'})
+
+
+# Cache policy for JSON views validated with ETag: always revalidate, 304 when unchanged
+REVALIDATE_CACHE_CONTROL = "private, max-age=0, must-revalidate"
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Check If-None-Match against etag (weak comparison)"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    bare = etag.removeprefix("W/")
+    return any(
+        tag == "*" or tag.strip().removeprefix("W/") == bare
+        for tag in if_none_match.split(",")
+    )
+
+
+def _json_response_with_etag(request: Request, content: bytes, etag: Optional[str] = None) -> Response:
+    """Return serialized JSON with ETag headers, or 304 when the client copy is current"""
+    if etag is None:
+        etag = f'W/"{hashlib.md5(content).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+def _claim_image_path(directory: Path, file_ext: str) -> tuple[str, Path]:
+    """
+    Atomically reserve a new img_<uuid> file name in directory.
+    The name is claimed with O_CREAT|O_EXCL (creating an empty placeholder to be overwritten),
+    so a collision fails the single open and simply retries with a new UUID.
+    """
+    while True:
+        filename = f"img_{uuid.uuid4().hex[:8]}{file_ext}"
+        file_path = directory / filename
+        try:
+            fd = os.open(file_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            continue
+        os.close(fd)
+        return filename, file_path
+
 
 def _slugify(text: str, max_len: int = 40) -> str:
     """Create filesystem-friendly slug."""
@@ -128,6 +183,18 @@ class ProjectResponse(BaseModel):
     created_at: Optional[str] = None
     updated_at: Optional[str] = None
 
+    @staticmethod
+    def from_row(row) -> dict:
+        """Create response dict from a (id, name, description, created_at, updated_at) row"""
+        project_id, name, description, created_at, updated_at = row
+        return {
+            "id": project_id,
+            "name": name,
+            "description": description or "",
+            "created_at": created_at.isoformat() if created_at else None,
+            "updated_at": updated_at.isoformat() if updated_at else None,
+        }
+
     @classmethod
     def from_orm(cls, obj: Project):
         """Create response model from ORM object"""
@@ -377,8 +444,15 @@ def create_project(project: ProjectCreate, db: Session = Depends(get_db)):
 @router.get("/projects", response_model=List[ProjectResponse])
 def list_projects(db: Session = Depends(get_db)):
     """List all projects"""
-    projects = db.query(Project).order_by(Project.created_at.desc()).all()
-    return [ProjectResponse.from_orm(p) for p in projects]
+    # Select plain column tuples and serialize once (skips ORM objects and per-row model validation)
+    rows = db.execute(
+        select(Project.id, Project.name, Project.description, Project.created_at, Project.updated_at)
+        .order_by(Project.created_at.desc())
+    ).all()
+    return Response(
+        content=json_dumps_bytes([ProjectResponse.from_row(row) for row in rows]),
+        media_type="application/json"
+    )
 
 
 @router.get("/models", response_model=List[ModelInfo])
@@ -673,20 +747,27 @@ def get_project(project_id: str, db: Session = Depends(get_db)):
 
 
 @router.delete("/projects/{project_id}")
-def delete_project(project_id: str, db: Session = Depends(get_db)):
+def delete_project(project_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """Delete project"""
     project = db.query(Project).filter(Project.id == project_id).first()
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
+    # Bulk delete annotations and images first so the ORM cascade doesn't load and delete them row by row
+    project_image_ids = select(Image.id).where(Image.project_id == project_id)
+    db.query(Annotation).filter(Annotation.image_id.in_(project_image_ids)).delete(synchronize_session=False)
+    db.query(Image).filter(Image.project_id == project_id).delete(synchronize_session=False)
+    
     db.delete(project)
     db.commit()
     
-    # Delete project directory
+    # Stop accepting MQTT uploads for the deleted project right away
+    mqtt_service.invalidate_project(project_id)
+    
+    # Delete project directory after the response is sent (can take seconds for large projects)
     project_dir = settings.DATASETS_ROOT / project_id
     if project_dir.exists():
-        import shutil
-        shutil.rmtree(project_dir)
+        background_tasks.add_task(shutil.rmtree, project_dir, ignore_errors=True)
     
     return {"message": "Project deleted"}
 
@@ -761,59 +842,64 @@ async def upload_image(
         raise HTTPException(status_code=404, detail="Project not found")
     
     # Verify file type
-    allowed_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp'}
     file_ext = Path(file.filename).suffix.lower()
-    if file_ext not in allowed_extensions:
+    if file_ext not in ALLOWED_IMAGE_EXTENSIONS:
         raise HTTPException(
             status_code=400,
-            detail=f"Unsupported file format: {file_ext}. Supported formats: {', '.join(allowed_extensions)}"
+            detail=f"Unsupported file format: {file_ext}. Supported formats: {', '.join(sorted(ALLOWED_IMAGE_EXTENSIONS))}"
         )
     
+    # Generate storage path
+    project_dir = settings.DATASETS_ROOT / project_id / "raw"
+    project_dir.mkdir(parents=True, exist_ok=True)
+    
+    tmp_path = None
+    file_path = None
     try:
-        # Read file content
-        file_content = await file.read()
-        
-        # Verify file size
-        size_mb = len(file_content) / (1024 * 1024)
-        if size_mb > settings.MAX_IMAGE_SIZE_MB:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File too large: {size_mb:.2f}MB (max: {settings.MAX_IMAGE_SIZE_MB}MB)"
-            )
+        # Stream file content to a temp file next to its destination, enforcing the size limit as we go
+        max_bytes = settings.MAX_IMAGE_SIZE_MB * 1024 * 1024
+        total_bytes = 0
+        with tempfile.NamedTemporaryFile(dir=project_dir, prefix=".upload_", suffix=file_ext, delete=False) as tmp:
+            tmp_path = Path(tmp.name)
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                total_bytes += len(chunk)
+                if total_bytes > max_bytes:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File too large: exceeds {settings.MAX_IMAGE_SIZE_MB}MB (max: {settings.MAX_IMAGE_SIZE_MB}MB)"
+                    )
+                tmp.write(chunk)
         
-        # Verify if valid image and get dimensions
+        # Verify if valid image and get dimensions (PIL only reads the header here)
         try:
-            img = PILImage.open(io.BytesIO(file_content))
-            img_width, img_height = img.size
+            img = PILImage.open(tmp_path)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
         
-        # Generate storage path
-        project_dir = settings.DATASETS_ROOT / project_id / "raw"
-        project_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Handle filename conflicts and Chinese filenames
         original_filename = file.filename or f"image_{uuid.uuid4().hex[:8]}{file_ext}"
-        # Handle Chinese filenames: use UUID to avoid encoding issues, but keep original extension
-        filename_stem = f"img_{uuid.uuid4().hex[:8]}"
-        filename = f"{filename_stem}{file_ext}"
-        file_path = project_dir / filename
-        
-        # If filename conflicts, add timestamp
-        counter = 0
-        while file_path.exists():
-            counter += 1
-            filename = f"{filename_stem}_{counter}{file_ext}"
-            file_path = project_dir / filename
-        
-        # Save file (convert image format if needed when saving)
-        if img.mode != 'RGB' and file_ext in ['.jpg', '.jpeg']:
-            # JPG format requires RGB mode
-            img_rgb = img.convert('RGB')
-            img_rgb.save(file_path, 'JPEG', quality=95)
+        # Handle filename conflicts and Chinese filenames: use UUID to avoid encoding issues, but keep original extension
+        filename, file_path = _claim_image_path(project_dir, file_ext)
+        
+        with img:
+            img_width, img_height = img.size
+            # Save file (convert image format only when really needed, mode comes from the header)
+            # RGB and grayscale JPEGs are stored as uploaded; only e.g. CMYK JPEGs are re-encoded
+            needs_conversion = file_ext in ['.jpg', '.jpeg'] and img.mode not in ('RGB', 'L')
+            if needs_conversion:
+                # JPG format requires RGB mode
+                img_rgb = img.convert('RGB')
+                img_rgb.save(file_path, 'JPEG', quality=95)
+        
+        if needs_conversion:
+            tmp_path.unlink()
         else:
-            # Other formats save original content directly
-            file_path.write_bytes(file_content)
+            # Other formats keep the original content, moved into place without copying
+            os.replace(tmp_path, file_path)
+        tmp_path = None
+        file_path = None  # Stored successfully, no longer a leftover to clean up
         
         # Generate relative path (only includes raw/filename, not project_id)
         relative_path = f"raw/{filename}"
@@ -857,30 +943,53 @@ async def upload_image(
     except Exception as e:
         print(f"[Upload] Error uploading image: {e}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    finally:
+        # Remove partially written upload and reserved file name on failure
+        for leftover in (tmp_path, file_path):
+            if leftover is not None and leftover.exists():
+                try:
+                    leftover.unlink()
+                except Exception:
+                    pass
 
 
 @router.get("/projects/{project_id}/images")
-def list_images(project_id: str, db: Session = Depends(get_db)):
+def list_images(project_id: str, request: Request, db: Session = Depends(get_db)):
     """List all images in project"""
-    images = db.query(Image).filter(Image.project_id == project_id).order_by(Image.created_at.desc()).all()
-    
-    result = []
-    for img in images:
-        result.append({
-            "id": img.id,
-            "filename": img.filename,
-            "path": img.path,
-            "width": img.width,
-            "height": img.height,
-            "status": img.status,
-            "created_at": img.created_at.isoformat() if img.created_at else None
-        })
+    # Cheap aggregate fingerprint: any insert, delete or status change alters count/max(id)/max(updated_at)
+    count, max_id, max_updated = db.execute(
+        select(func.count(Image.id), func.max(Image.id), func.max(Image.updated_at))
+        .where(Image.project_id == project_id)
+    ).one()
+    etag = f'W/"{count}-{max_id}-{max_updated.timestamp() if max_updated else 0}"'
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL})
+    
+    # Select plain column tuples and serialize once (skips ORM objects and the generic response encoder)
+    rows = db.execute(
+        select(Image.id, Image.filename, Image.path, Image.width, Image.height, Image.status, Image.created_at)
+        .where(Image.project_id == project_id)
+        .order_by(Image.created_at.desc())
+    ).all()
+    
+    result = [
+        {
+            "id": image_id,
+            "filename": filename,
+            "path": path,
+            "width": width,
+            "height": height,
+            "status": status,
+            "created_at": created_at.isoformat() if created_at else None
+        }
+        for image_id, filename, path, width, height, status, created_at in rows
+    ]
     
-    return result
+    return _json_response_with_etag(request, json_dumps_bytes(result), etag)
 
 
 @router.get("/projects/{project_id}/images/{image_id}")
-def get_image(project_id: str, image_id: int, db: Session = Depends(get_db)):
+def get_image(project_id: str, image_id: int, request: Request, db: Session = Depends(get_db)):
     """Get image details (including annotations)"""
     image = db.query(Image).filter(
         Image.id == image_id,
@@ -889,22 +998,24 @@ def get_image(project_id: str, image_id: int, db: Session = Depends(get_db)):
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
     
-    # Get annotations
-    annotations = db.query(Annotation).filter(Annotation.image_id == image_id).all()
+    # Get annotations (class loaded in the same query)
+    annotations = db.query(Annotation).options(joinedload(Annotation.class_)).filter(
+        Annotation.image_id == image_id
+    ).all()
     
     ann_list = []
     for ann in annotations:
-        class_obj = db.query(Class).filter(Class.id == ann.class_id).first()
+        class_obj = ann.class_
         ann_list.append({
             "id": ann.id,
             "type": ann.type,
-            "data": json.loads(ann.data) if isinstance(ann.data, str) else ann.data,
+            "data": ann.data,
             "class_id": ann.class_id,
             "class_name": class_obj.name if class_obj else None,
             "class_color": class_obj.color if class_obj else None
         })
     
-    return {
+    result = {
         "id": image.id,
         "filename": image.filename,
         "path": image.path,
@@ -913,6 +1024,9 @@ def get_image(project_id: str, image_id: int, db: Session = Depends(get_db)):
         "status": image.status,
         "annotations": ann_list
     }
+    
+    # ETag is derived from the payload itself, so annotation and class changes are always picked up
+    return _json_response_with_etag(request, json_dumps_bytes(result))
 
 
 @router.delete("/projects/{project_id}/images/{image_id}")
@@ -926,10 +1040,8 @@ def delete_image(project_id: str, image_id: int, db: Session = Depends(get_db)):
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
     
-    # Delete associated annotation data first to avoid orphaned records
-    annotations = db.query(Annotation).filter(Annotation.image_id == image_id).all()
-    for ann in annotations:
-        db.delete(ann)
+    # Delete associated annotation data first to avoid orphaned records (single bulk DELETE)
+    db.query(Annotation).filter(Annotation.image_id == image_id).delete(synchronize_session=False)
     
     # Delete image file
     image_path = settings.DATASETS_ROOT / project_id / image.path
@@ -969,7 +1081,7 @@ def create_annotation(image_id: int, annotation: AnnotationCreate, db: Session =
         image_id=image_id,
         class_id=annotation.class_id,
         type=annotation.type,
-        data=json.dumps(annotation.data)
+        data=annotation.data
     )
     
     db.add(db_annotation)
@@ -1003,7 +1115,7 @@ def update_annotation(annotation_id: int, annotation: AnnotationUpdate, db: Sess
     project_id = image.project_id if image else None
     
     if annotation.data is not None:
-        db_ann.data = json.dumps(annotation.data)
+        db_ann.data = annotation.data
     
     if annotation.class_id is not None:
         db_ann.class_id = annotation.class_id
@@ -1038,9 +1150,15 @@ def delete_annotation(annotation_id: int, db: Session = Depends(get_db)):
     db.delete(db_ann)
     
     # Check if there are remaining annotations, update status if none
-    remaining = db.query(Annotation).filter(Annotation.image_id == image_id).count()
+    # EXISTS stops at the first match; the deleted row is excluded since the session does not autoflush
+    has_remaining = db.query(
+        db.query(Annotation).filter(
+            Annotation.image_id == image_id,
+            Annotation.id != annotation_id
+        ).exists()
+    ).scalar()
     status_changed = False
-    if remaining == 0:
+    if not has_remaining:
         if image and image.status == "LABELED":
             image.status = "UNLABELED"
             status_changed = True
@@ -1072,6 +1190,7 @@ def delete_annotation(annotation_id: int, db: Session = Depends(get_db)):
 @router.post("/projects/{project_id}/dataset/import")
 async def import_dataset(
     project_id: str,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     format_type: str = Query(..., description="Dataset format: 'coco', 'yolo' or 'project_zip'"),
     db: Session = Depends(get_db)
@@ -1087,6 +1206,7 @@ async def import_dataset(
     
     temp_file = None
     temp_dir = None
+    succeeded = False
     try:
         # Save uploaded file to temp location
         file_ext = Path(file.filename).suffix.lower() if file.filename else ''
@@ -1101,6 +1221,10 @@ async def import_dataset(
             dataset_data = DatasetImporter.import_dataset(project_id, temp_file, 'coco')
         elif format_type == 'yolo':
             dataset_data = DatasetImporter.import_dataset(project_id, temp_file, 'yolo')
+            # ZIP uploads are extracted by the importer, the images are copied from there below
+            extracted_dir = dataset_data.pop("extracted_dir", None)
+            if extracted_dir:
+                temp_dir = Path(extracted_dir)
         elif format_type == 'project_zip':
             temp_dir = Path(tempfile.mkdtemp())
             try:
@@ -1114,7 +1238,7 @@ async def import_dataset(
             class_id_map = {}
             if classes_file.exists():
                 try:
-                    classes_json = json.loads(classes_file.read_text())
+                    classes_json = json_loads(classes_file.read_bytes())
                     classes_data = classes_json.get("classes", [])
                     for cls in classes_data:
                         if "id" in cls:
@@ -1147,9 +1271,8 @@ async def import_dataset(
                 if name:
                     ensure_category(name, cls.get("color"))
 
-            allowed_exts = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp"}
             for img_path in images_dir.rglob("*"):
-                if not img_path.is_file() or img_path.suffix.lower() not in allowed_exts:
+                if not img_path.is_file() or img_path.suffix.lower() not in ALLOWED_IMAGE_EXTENSIONS:
                     continue
 
                 try:
@@ -1163,7 +1286,7 @@ async def import_dataset(
                 ann_path = annotations_dir / f"{img_path.stem}.json"
                 if ann_path.exists():
                     try:
-                        ann_json = json.loads(ann_path.read_text())
+                        ann_json = json_loads(ann_path.read_bytes())
                         if isinstance(ann_json, list):
                             for ann in ann_json:
                                 cat_name = ann.get("class_name") or ann.get("category_name")
@@ -1256,18 +1379,8 @@ async def import_dataset(
                     errors.append(f"Image file not found: {img_filename}")
                     continue
                 
-                # Copy image to project directory
-                file_ext = img_path.suffix
-                filename_stem = f"img_{uuid.uuid4().hex[:8]}"
-                filename = f"{filename_stem}{file_ext}"
-                dest_path = project_dir / filename
-                
-                # Handle filename conflicts
-                counter = 0
-                while dest_path.exists():
-                    counter += 1
-                    filename = f"{filename_stem}_{counter}{file_ext}"
-                    dest_path = project_dir / filename
+                # Copy image to project directory (file name reserved atomically)
+                filename, dest_path = _claim_image_path(project_dir, img_path.suffix)
                 
                 # Copy file
                 shutil.copy2(img_path, dest_path)
@@ -1305,7 +1418,7 @@ async def import_dataset(
                         image_id=db_image.id,
                         class_id=class_id,
                         type=annotation_type,
-                        data=json.dumps(annotation_data)
+                        data=annotation_data
                     )
                     db.add(db_annotation)
                     annotations_imported += 1
@@ -1335,6 +1448,7 @@ async def import_dataset(
         if errors:
             result["error_count"] = len(errors)
         
+        succeeded = True
         return result
         
     except ValueError as e:
@@ -1343,20 +1457,16 @@ async def import_dataset(
         logger.error(f"[Dataset Import] Import failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
     finally:
-        # Cleanup temp files
-        if temp_file and temp_file.exists():
-            try:
-                if temp_file.is_file():
-                    temp_file.unlink()
-                elif temp_file.is_dir():
-                    shutil.rmtree(temp_file, ignore_errors=True)
-            except Exception:
-                pass
-        if temp_dir and Path(temp_dir).exists():
-            try:
-                shutil.rmtree(temp_dir, ignore_errors=True)
-            except Exception:
-                pass
+        # Cleanup temp files (the whole mkdtemp directory of the upload and the extraction directory)
+        temp_paths = [p for p in (temp_file.parent if temp_file else None, temp_dir) if p is not None]
+        if succeeded:
+            # Removed after the response is sent
+            for temp_path in temp_paths:
+                background_tasks.add_task(shutil.rmtree, temp_path, ignore_errors=True)
+        else:
+            # Error responses don't run background tasks, clean up now (off the event loop)
+            for temp_path in temp_paths:
+                await run_in_threadpool(shutil.rmtree, temp_path, ignore_errors=True)
 
 
 # ========== WebSocket ==========
@@ -1366,14 +1476,13 @@ async def import_dataset(
 
 # ========== Image File Service ==========
 
+# Resolved once at import; image requests are validated with a cheap segment check instead of resolve()
+DATASETS_ROOT_RESOLVED = settings.DATASETS_ROOT.resolve()
+
+
 @router.get("/images/{project_id}/{image_path:path}")
-def get_image_file(project_id: str, image_path: str):
+async def get_image_file(project_id: str, image_path: str, request: Request):
     """Retrieve image file"""
-    import os
-    from pathlib import Path
-    
-    print(f"[Image] Request received: project_id={project_id}, image_path={image_path}")
-    
     # image_path should be in raw/filename format
     # Remove possible project_id prefix (for compatibility with old data)
     if image_path.startswith(f"{project_id}/"):
@@ -1384,38 +1493,29 @@ def get_image_file(project_id: str, image_path: str):
         # If path doesn't contain raw/, might be old format, try to add
         image_path = f"raw/{image_path}"
     
-    # Build file path
-    file_path = settings.DATASETS_ROOT / project_id / image_path
-    
-    # Normalize path, handle potential path traversal attacks
-    try:
-        resolved_path = file_path.resolve()
-        datasets_root = settings.DATASETS_ROOT.resolve()
-        # Ensure resolved path is within datasets root directory
-        resolved_path.relative_to(datasets_root)
-    except ValueError:
-        print(f"[Image] Security check failed: {resolved_path} not under {datasets_root}")
+    # Reject path traversal attempts (parent segments, separators smuggled in project_id)
+    if (project_id in ("", ".", "..") or "/" in project_id or "\\" in project_id or
+            "\\" in image_path or ".." in image_path.split("/")):
         raise HTTPException(status_code=403, detail="Access denied: Invalid path")
     
-    print(f"[Image] Resolved path: {resolved_path}")
-    print(f"[Image] Path exists: {resolved_path.exists()}")
-    print(f"[Image] DATASETS_ROOT: {datasets_root}")
+    # Build file path
+    file_path = DATASETS_ROOT_RESOLVED / project_id / image_path
     
-    if not resolved_path.exists():
-        # Try listing directory contents for debugging
-        project_dir = settings.DATASETS_ROOT / project_id / "raw"
-        if project_dir.exists():
-            files = list(project_dir.glob("*"))
-            print(f"[Image] Files in raw dir: {[f.name for f in files]}")
-        else:
-            print(f"[Image] Raw directory does not exist: {project_dir}")
-        raise HTTPException(status_code=404, detail=f"Image not found: {image_path} (resolved: {resolved_path})")
+    # Ensure it exists and is a file, not a directory (stat off the event loop: slow disks/NFS block)
+    try:
+        stat_result = await run_in_threadpool(os.stat, file_path)
+    except OSError:
+        raise HTTPException(status_code=404, detail=f"Image not found: {image_path}")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail=f"Image not found: {image_path}")
     
-    # Ensure it's a file, not a directory
-    if not resolved_path.is_file():
-        raise HTTPException(status_code=404, detail="Path is not a file")
+    # Weak ETag from (inode, mtime, size); unchanged images are answered with 304
+    etag = f'W/"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
     
-    return FileResponse(str(resolved_path))
+    # FileResponse streams the file with sendfile where the server supports it
+    return FileResponse(str(file_path), stat_result=stat_result, headers={"ETag": etag})
 
 
 # ========== YOLO Export ==========
@@ -1427,9 +1527,12 @@ def export_yolo(project_id: str, db: Session = Depends(get_db)):
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Get all images and annotations
-    images = db.query(Image).filter(Image.project_id == project_id).all()
+    # Get all images and annotations (annotations preloaded in a single extra query)
+    images = db.query(Image).options(selectinload(Image.annotations)).filter(
+        Image.project_id == project_id
+    ).all()
     classes = db.query(Class).filter(Class.project_id == project_id).all()
+    class_map = {c.id: c for c in classes}
     
     # Build export data
     project_data = {
@@ -1440,15 +1543,13 @@ def export_yolo(project_id: str, db: Session = Depends(get_db)):
     }
     
     for img in images:
-        annotations = db.query(Annotation).filter(Annotation.image_id == img.id).all()
-        
         ann_list = []
-        for ann in annotations:
-            class_obj = db.query(Class).filter(Class.id == ann.class_id).first()
+        for ann in img.annotations:
+            class_obj = class_map.get(ann.class_id)
             ann_list.append({
                 "id": ann.id,
                 "type": ann.type,
-                "data": json.loads(ann.data) if isinstance(ann.data, str) else ann.data,
+                "data": ann.data,
                 "class_name": class_obj.name if class_obj else None
             })
         
@@ -1484,25 +1585,14 @@ def download_yolo_export(project_id: str, db: Session = Depends(get_db)):
     if not output_dir.exists():
         raise HTTPException(status_code=404, detail="YOLO export not found. Please export first.")
     
-    # Create temporary zip file
-    zip_path = settings.DATASETS_ROOT / project_id / f"{project.name}_yolo_dataset.zip"
-    
-    def generate_zip():
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_path in output_dir.rglob('*'):
-                if file_path.is_file():
-                    arcname = file_path.relative_to(output_dir)
-                    zipf.write(file_path, arcname)
-        
-        with open(zip_path, 'rb') as f:
-            yield from f
-        
-        # Clean up temporary files
-        if zip_path.exists():
-            zip_path.unlink()
+    # Build the zip on the fly while streaming it to the client
+    def iter_entries():
+        for file_path in output_dir.rglob('*'):
+            if file_path.is_file():
+                yield file_path.relative_to(output_dir).as_posix(), file_path
     
     return StreamingResponse(
-        generate_zip(),
+        stream_zip(iter_entries()),
         media_type="application/zip",
         headers={
             "Content-Disposition": f"attachment; filename={project.name}_yolo_dataset.zip"
@@ -1517,58 +1607,50 @@ def export_dataset_zip(project_id: str, db: Session = Depends(get_db)):
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    images = db.query(Image).filter(Image.project_id == project_id).all()
+    images = db.query(Image).options(selectinload(Image.annotations)).filter(
+        Image.project_id == project_id
+    ).all()
     classes = db.query(Class).filter(Class.project_id == project_id).all()
+    class_map = {c.id: c for c in classes}
     
     if not images:
         raise HTTPException(status_code=400, detail="No images in project")
     
-    # Create temporary zip file
-    zip_path = settings.DATASETS_ROOT / project_id / f"{project.name}_dataset.zip"
-    
-    def generate_zip():
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Add class information
-            classes_info = {
-                "classes": [{"id": c.id, "name": c.name, "color": c.color} for c in classes]
-            }
-            zipf.writestr("classes.json", json.dumps(classes_info, ensure_ascii=False, indent=2))
+    # Build the zip on the fly while streaming it to the client
+    def iter_entries():
+        # Add class information
+        classes_info = {
+            "classes": [{"id": c.id, "name": c.name, "color": c.color} for c in classes]
+        }
+        yield "classes.json", json_dumps_bytes(classes_info, indent=True)
+        
+        # Add images and annotations
+        for img in images:
+            # Add image file
+            img_path = settings.DATASETS_ROOT / project_id / img.path
+            if img_path.exists():
+                yield f"images/{img.filename}", img_path
             
-            # Add images and annotations
-            for img in images:
-                # Add image file
-                img_path = settings.DATASETS_ROOT / project_id / img.path
-                if img_path.exists():
-                    zipf.write(img_path, f"images/{img.filename}")
+            # Get annotations (preloaded with the images)
+            annotations = img.annotations
+            if annotations:
+                ann_list = []
+                for ann in annotations:
+                    class_obj = class_map.get(ann.class_id)
+                    ann_list.append({
+                        "id": ann.id,
+                        "type": ann.type,
+                        "data": ann.data,
+                        "class_id": ann.class_id,
+                        "class_name": class_obj.name if class_obj else None
+                    })
                 
-                # Get annotations
-                annotations = db.query(Annotation).filter(Annotation.image_id == img.id).all()
-                if annotations:
-                    ann_list = []
-                    for ann in annotations:
-                        class_obj = db.query(Class).filter(Class.id == ann.class_id).first()
-                        ann_data = json.loads(ann.data) if isinstance(ann.data, str) else ann.data
-                        ann_list.append({
-                            "id": ann.id,
-                            "type": ann.type,
-                            "data": ann_data,
-                            "class_id": ann.class_id,
-                            "class_name": class_obj.name if class_obj else None
-                        })
-                    
-                    # Save annotations as JSON
-                    ann_filename = Path(img.filename).stem + ".json"
-                    zipf.writestr(f"annotations/{ann_filename}", json.dumps(ann_list, ensure_ascii=False, indent=2))
-        
-        with open(zip_path, 'rb') as f:
-            yield from f
-        
-        # Clean up temporary files
-        if zip_path.exists():
-            zip_path.unlink()
+                # Save annotations as JSON
+                ann_filename = Path(img.filename).stem + ".json"
+                yield f"annotations/{ann_filename}", json_dumps_bytes(ann_list, indent=True)
     
     return StreamingResponse(
-        generate_zip(),
+        stream_zip(iter_entries()),
         media_type="application/zip",
         headers={
             "Content-Disposition": f"attachment; filename={project.name}_dataset.zip"
@@ -1621,7 +1703,7 @@ async def start_training(project_id: str, request: TrainingRequest, db: Session
             ann_list.append({
                 "id": ann.id,
                 "type": ann.type,
-                "data": json.loads(ann.data) if isinstance(ann.data, str) else ann.data,
+                "data": ann.data,
                 "class_name": class_obj.name if class_obj else None
             })
         project_data["images"].append({
@@ -2756,7 +2838,7 @@ async def test_model(
         img_buffer = io.BytesIO()
         annotated_pil.save(img_buffer, format='PNG')
         img_buffer.seek(0)
-        img_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
+        img_base64 = base64.b64encode(img_buffer.getbuffer()).decode('ascii')
         
         return {
             "detections": detections,
@@ -4545,7 +4627,7 @@ async def _test_tflite_model(
         img_buffer = io.BytesIO()
         annotated_image.save(img_buffer, format='PNG')
         img_buffer.seek(0)
-        img_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
+        img_base64 = base64.b64encode(img_buffer.getbuffer()).decode('ascii')
         
         debug_line = (
             f"[TFLiteTest] model_path={model_path} input_dtype={input_dtype} "
@@ -4800,7 +4882,7 @@ async def test_model_by_id(
         img_buffer = io.BytesIO()
         annotated_pil.save(img_buffer, format='PNG')
         img_buffer.seek(0)
-        img_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
+        img_base64 = base64.b64encode(img_buffer.getbuffer()).decode('ascii')
         
         return {
             "detections": detections,
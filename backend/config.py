@@ -1,16 +1,67 @@
 """Configuration file"""
+import ipaddress
+import re
 import socket
+import struct
 import os
+from functools import lru_cache
 from pathlib import Path
 from pydantic_settings import BaseSettings
 
 BASE_DIR = Path(__file__).parent.parent
+BASE_DIR_STR = str(BASE_DIR)
 DATASETS_DIR = BASE_DIR / "datasets"
+DATA_DIR = BASE_DIR / "data"
+
+
+def _read_host_ip_env():
+    """First host IP set in the environment (Docker Compose or manual config), None if unset or invalid"""
+    host_ip = next((v for v in (os.environ.get(k) for k in ("HOST_IP", "HOSTIP", "MQTT_BROKER_HOST", "SERVER_IP")) if v), None)
+    if host_ip:
+        try:
+            socket.inet_aton(host_ip)
+            return host_ip
+        except OSError:
+            pass
+    return None
+
+
+# Environment is fixed for the process lifetime, read and validated once
+_HOST_IP_ENV = _read_host_ip_env()
+
+# Host header values that never identify the server to external devices
+_LOCAL_HOSTS = frozenset({"localhost", "127.0.0.1", "0.0.0.0"})
+
+# Default route entry in /proc/net/route: "<iface> 00000000 <gateway hex> ..."
+_DEFAULT_ROUTE_RE = re.compile(r"^\S+\s+00000000\s+([0-9A-Fa-f]{8})", re.M)
+
+# Docker bridge networks (172.17.0.0 - 172.31.255.255) as an integer interval
+_DOCKER_NET_LO = int(ipaddress.IPv4Address("172.17.0.0"))
+_DOCKER_NET_HI = int(ipaddress.IPv4Address("172.31.255.255"))
+
+
+def _is_docker_ip(ip: str) -> bool:
+    """Whether ip is a Docker container/bridge network address"""
+    try:
+        n = struct.unpack("!I", socket.inet_aton(ip))[0]
+    except (OSError, ValueError):
+        return False
+    return _DOCKER_NET_LO <= n <= _DOCKER_NET_HI
 
 
 def get_local_ip() -> str:
     """Get local IP address (prefer returning non-container internal IP)
     
+    Detection spawns subprocesses and does DNS lookups, so the result is computed
+    once per process and then served from cache (see _detect_local_ip).
+    """
+    return _detect_local_ip()
+
+
+@lru_cache(maxsize=1)
+def _detect_local_ip() -> str:
+    """Detect local IP address (prefer returning non-container internal IP)
+    
     Improved detection for Docker environments:
     1. Check MQTT_BROKER_HOST environment variable first (highest priority, avoids warnings)
     2. Try host.docker.internal (Docker Desktop / some Docker versions)
@@ -20,9 +71,7 @@ def get_local_ip() -> str:
     6. Fallback to hostname resolution
     """
     import subprocess
-    import re
     
-    container_ranges = ['172.17.', '172.18.', '172.19.', '172.20.', '172.21.', '172.22.', '172.23.', '172.24.', '172.25.', '172.26.', '172.27.', '172.28.', '172.29.', '172.30.', '172.31.']
     # Docker Desktop virtual network ranges (macOS/Windows)
     # These are virtual network IPs created by Docker Desktop, not the actual host IP
     docker_desktop_ranges = ['192.168.65.', '192.168.49.', '192.168.39.', '10.0.2.']
@@ -34,7 +83,7 @@ def get_local_ip() -> str:
             socket.inet_aton(env_ip)
             # Verify it's not a container IP or Docker Desktop virtual IP
             if (env_ip != '127.0.0.1' and 
-                not any(env_ip.startswith(prefix) for prefix in container_ranges) and
+                not _is_docker_ip(env_ip) and
                 not any(env_ip.startswith(prefix) for prefix in docker_desktop_ranges)):
                 return env_ip
         except:
@@ -48,7 +97,7 @@ def get_local_ip() -> str:
         try:
             host_ip = socket.gethostbyname('host.docker.internal')
             if (host_ip and host_ip != '127.0.0.1' and 
-                not any(host_ip.startswith(prefix) for prefix in container_ranges) and
+                not _is_docker_ip(host_ip) and
                 not any(host_ip.startswith(prefix) for prefix in docker_desktop_ranges)):
                 return host_ip
         except (socket.gaierror, OSError):
@@ -83,7 +132,7 @@ def get_local_ip() -> str:
                             if inet_match:
                                 ip = inet_match.group(1)
                                 if (ip != '127.0.0.1' and 
-                                    not any(ip.startswith(prefix) for prefix in container_ranges) and
+                                    not _is_docker_ip(ip) and
                                     not any(ip.startswith(prefix) for prefix in docker_desktop_ranges)):
                                     return ip
             
@@ -101,7 +150,7 @@ def get_local_ip() -> str:
                 if inet_match:
                     ip = inet_match.group(1)
                     if (ip != '127.0.0.1' and 
-                        not any(ip.startswith(prefix) for prefix in container_ranges) and
+                        not _is_docker_ip(ip) and
                         not any(ip.startswith(prefix) for prefix in docker_desktop_ranges)):
                         return ip
     except (subprocess.TimeoutExpired, FileNotFoundError, Exception):
@@ -134,7 +183,7 @@ def get_local_ip() -> str:
                             if inet_match:
                                 ip = inet_match.group(1)
                                 if (ip != '127.0.0.1' and 
-                                    not any(ip.startswith(prefix) for prefix in container_ranges) and
+                                    not _is_docker_ip(ip) and
                                     not any(ip.startswith(prefix) for prefix in docker_desktop_ranges)):
                                     return ip
             
@@ -151,7 +200,7 @@ def get_local_ip() -> str:
                 if inet_match:
                     ip = inet_match.group(1)
                     if (ip != '127.0.0.1' and 
-                        not any(ip.startswith(prefix) for prefix in container_ranges) and
+                        not _is_docker_ip(ip) and
                         not any(ip.startswith(prefix) for prefix in docker_desktop_ranges)):
                         return ip
     except (subprocess.TimeoutExpired, FileNotFoundError, Exception):
@@ -159,41 +208,34 @@ def get_local_ip() -> str:
         pass
     
     # Method 3: Get local IP by connecting to external address (standard method)
+    # UDP connect sends no packet, the kernel only picks the source address from the routing table.
+    # This is the only socket probe; its result is reused for the Docker checks below.
     detected_container_ip = None
     try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.settimeout(0)
-        try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.setblocking(False)
             s.connect(('8.8.8.8', 80))
             ip = s.getsockname()[0]
-            s.close()
-            # If obtained IP is not container internal IP, Docker Desktop virtual IP, or localhost, can use it
-            if (ip != '127.0.0.1' and 
-                not any(ip.startswith(prefix) for prefix in container_ranges) and
-                not any(ip.startswith(prefix) for prefix in docker_desktop_ranges)):
-                return ip
-            # Store container IP for later use (if we're in Docker)
-            if any(ip.startswith(prefix) for prefix in container_ranges):
-                detected_container_ip = ip
-        except Exception:
-            pass
-        finally:
-            try:
-                s.close()
-            except:
-                pass
+        # If obtained IP is not container internal IP, Docker Desktop virtual IP, or localhost, can use it
+        if (ip != '127.0.0.1' and 
+            not _is_docker_ip(ip) and
+            not any(ip.startswith(prefix) for prefix in docker_desktop_ranges)):
+            return ip
+        # Store container IP for later use (if we're in Docker)
+        if _is_docker_ip(ip):
+            detected_container_ip = ip
     except Exception:
         pass
     
-    # Method 4: Use hostname
+    # Method 4: Use hostname (getaddrinfo honours nsswitch ordering, AI_ADDRCONFIG skips unconfigured families)
     try:
-        ip = socket.gethostbyname(socket.gethostname())
+        ip = socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET, socket.SOCK_DGRAM, 0, socket.AI_ADDRCONFIG)[0][4][0]
         if ip != '127.0.0.1':
-            if (not any(ip.startswith(prefix) for prefix in container_ranges) and
+            if (not _is_docker_ip(ip) and
                 not any(ip.startswith(prefix) for prefix in docker_desktop_ranges)):
                 return ip
             # Store container IP for later use
-            if not detected_container_ip and any(ip.startswith(prefix) for prefix in container_ranges):
+            if not detected_container_ip and _is_docker_ip(ip):
                 detected_container_ip = ip
     except Exception:
         pass
@@ -201,60 +243,23 @@ def get_local_ip() -> str:
     # Method 5: If we detected a container IP, try to get host IP via Docker gateway
     # In Docker, the default gateway is usually the Docker host IP
     if detected_container_ip or any(os.path.exists(p) for p in ['/.dockerenv', '/proc/1/cgroup']):
-        # We're likely in a Docker container, try to get host IP via gateway
-        try:
-            import subprocess
-            # Try to get default gateway IP
-            result = subprocess.run(
-                ['ip', 'route', 'show', 'default'],
-                capture_output=True,
-                text=True,
-                timeout=2
-            )
-            if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    if 'default via' in line:
-                        parts = line.split()
-                        for i, part in enumerate(parts):
-                            if part == 'via' and i + 1 < len(parts):
-                                gateway_ip = parts[i + 1]
-                                try:
-                                    socket.inet_aton(gateway_ip)
-                                    # Gateway IP is usually Docker host IP
-                                    # But we need to verify it's not a container IP or Docker Desktop virtual IP
-                                    if (gateway_ip != '127.0.0.1' and 
-                                        not any(gateway_ip.startswith(prefix) for prefix in container_ranges) and
-                                        not any(gateway_ip.startswith(prefix) for prefix in docker_desktop_ranges)):
-                                        return gateway_ip
-                                except:
-                                    pass
-        except Exception:
-            pass
-        
-        # Alternative: Try to get gateway from /proc/net/route
-        try:
-            with open("/proc/net/route", "r") as f:
-                for line in f:
-                    parts = line.split()
-                    if len(parts) >= 2 and parts[1] == "00000000":  # default route
-                        if len(parts) >= 3:
-                            gateway_hex = parts[2]
-                            gateway_ip = ".".join([
-                                str(int(gateway_hex[i:i+2], 16)) 
-                                for i in range(6, -1, -2)
-                            ])
-                            try:
-                                socket.inet_aton(gateway_ip)
-                                # Gateway IP might be Docker host IP
-                                # But exclude Docker Desktop virtual network IPs
-                                if (gateway_ip != '127.0.0.1' and 
-                                    not any(gateway_ip.startswith(prefix) for prefix in container_ranges) and
-                                    not any(gateway_ip.startswith(prefix) for prefix in docker_desktop_ranges)):
-                                    return gateway_ip
-                            except:
-                                pass
-        except Exception:
-            pass
+        # We're likely in a Docker container, the default gateway from /proc/net/route
+        # is usually the Docker host IP (plain file read, no 'ip route' subprocess)
+        if os.path.exists("/proc/net/route"):
+            try:
+                with open("/proc/net/route", "r", errors="ignore") as f:
+                    match = _DEFAULT_ROUTE_RE.search(f.read())
+                if match:
+                    # Gateway is little-endian hex, e.g. 0100A8C0 -> 192.168.0.1
+                    gateway_ip = socket.inet_ntoa(bytes.fromhex(match.group(1))[::-1])
+                    # Gateway IP might be Docker host IP
+                    # But exclude Docker Desktop virtual network IPs
+                    if (gateway_ip != '127.0.0.1' and 
+                        not _is_docker_ip(gateway_ip) and
+                        not any(gateway_ip.startswith(prefix) for prefix in docker_desktop_ranges)):
+                        return gateway_ip
+            except Exception:
+                pass
         
         # Method 6: Try to get host IP from Docker network information using docker inspect
         # This requires access to docker socket, which is available in docker-compose.yml
@@ -273,7 +278,7 @@ def get_local_ip() -> str:
                     socket.inet_aton(gateway_ip)
                     # Exclude Docker Desktop virtual network IPs
                     if (gateway_ip != '127.0.0.1' and 
-                        not any(gateway_ip.startswith(prefix) for prefix in container_ranges) and
+                        not _is_docker_ip(gateway_ip) and
                         not any(gateway_ip.startswith(prefix) for prefix in docker_desktop_ranges)):
                         return gateway_ip
                 except:
@@ -282,59 +287,6 @@ def get_local_ip() -> str:
             # Docker command not available or failed, continue
             pass
         
-        # Method 7: Try to get host IP by connecting to host network from container
-        # In some Docker setups, we can access host services via special IPs
-        # Try common Docker host access patterns
-        try:
-            # Try to connect to host via gateway and get the IP that host sees
-            # This is a heuristic: try to get the IP that would be used to reach the host
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.settimeout(0.1)
-            try:
-                # Connect to a known external address to determine our route
-                s.connect(('8.8.8.8', 80))
-                local_ip = s.getsockname()[0]
-                s.close()
-                
-                # If we got a container IP, try to infer host IP
-                # Common pattern: if container is 172.17.0.x, host might be 172.17.0.1
-                # But we want the actual host's LAN IP, not the Docker bridge IP
-                # So we'll try to get the IP from the host's perspective
-                if any(local_ip.startswith(prefix) for prefix in container_ranges):
-                    # We're on a Docker network, try to get host IP from network info
-                    # Get network name from container
-                    container_name = os.environ.get("CONTAINER_NAME", "camthink-aitoolstack")
-                    try:
-                        # Try to get network gateway which is often the host IP on the Docker network
-                        result = subprocess.run(
-                            ['docker', 'inspect', '--format', '{{range $key, $value := .NetworkSettings.Networks}}{{$value.Gateway}}{{end}}', container_name],
-                            capture_output=True,
-                            text=True,
-                            timeout=2
-                        )
-                        if result.returncode == 0:
-                            gateway_ip = result.stdout.strip()
-                            if gateway_ip:
-                                try:
-                                    socket.inet_aton(gateway_ip)
-                                    # Gateway might be Docker bridge IP, but let's check if it's not in container ranges
-                                    # Actually, gateway is usually in container ranges, so we need another approach
-                                    # Try to get the host's actual IP by checking what IP the host would use
-                                    # This is tricky - we might need to use a different method
-                                except:
-                                    pass
-                    except:
-                        pass
-            except:
-                pass
-            finally:
-                try:
-                    s.close()
-                except:
-                    pass
-        except Exception:
-            pass
-        
         # Method 8: Try to read host IP from /etc/hosts (some Docker setups add host IP there)
         try:
             with open("/etc/hosts", "r") as f:
@@ -349,7 +301,7 @@ def get_local_ip() -> str:
                             socket.inet_aton(ip)
                             # Exclude Docker Desktop virtual network IPs
                             if (ip != '127.0.0.1' and 
-                                not any(ip.startswith(prefix) for prefix in container_ranges) and
+                                not _is_docker_ip(ip) and
                                 not any(ip.startswith(prefix) for prefix in docker_desktop_ranges) and
                                 ('host.docker.internal' in hostnames or 
                                  any('host' in h.lower() for h in hostnames))):
@@ -358,69 +310,9 @@ def get_local_ip() -> str:
                             pass
         except Exception:
             pass
-        
-        # Method 9: For Docker Desktop on macOS/Windows, try to get actual host IP
-        # by attempting to connect to host services and inferring the IP
-        # In Docker Desktop, the host's actual network IP is not directly visible
-        # We can try to get it by checking what IP the host would use for external connections
-        try:
-            # Try to get the IP that would be used to reach the host from outside
-            # This is a heuristic: try common patterns
-            # First, try to see if we can get host IP from Docker network bridge
-            container_name = os.environ.get("CONTAINER_NAME", "camthink-aitoolstack")
-            try:
-                # Get all network interfaces from the host perspective
-                # In Docker Desktop, we can try to infer host IP from network configuration
-                result = subprocess.run(
-                    ['docker', 'exec', container_name, 'sh', '-c', 'ip route | grep default'],
-                    capture_output=True,
-                    text=True,
-                    timeout=2
-                )
-                # Actually, we're already inside the container, so we can't exec into ourselves
-                # Instead, let's try a different approach: check if we're in Docker Desktop
-                # and try to get host IP via special methods
-                
-                # In Docker Desktop, we can try to connect to a service on the host
-                # to determine the host's actual IP on the LAN
-                # But this requires the host to have a service running, which is not guaranteed
-                
-                # Alternative: Try to parse network information more carefully
-                # Look for IPs that are NOT in Docker ranges but are reachable
-                pass
-            except Exception:
-                pass
-        except Exception:
-            pass
     
-    # If all fail, try one more method: check if we can get host IP from Docker network
-    # In Docker Desktop, we can try to get the host's actual IP by checking network configuration
+    # If all fail and we're in Docker, the host IP has to be configured explicitly
     if any(os.path.exists(p) for p in ['/.dockerenv', '/proc/1/cgroup']):
-        # We're in Docker, try additional methods
-        try:
-            # Method 10: Try to get host IP from Docker network bridge information
-            # In some Docker setups, we can infer host IP from network configuration
-            import subprocess
-            # Try to get the IP that the host would use to reach the container
-            # This is a heuristic: if we can determine the host's network interface IP
-            # by checking what IP the host would use to connect to us
-            
-            # Try to get host IP by checking Docker network gateway
-            # The gateway is usually the Docker host IP on the bridge network
-            # But we want the host's actual LAN IP, not the bridge IP
-            # So we'll try to get it from the host's perspective if possible
-            
-            # For Docker Desktop on macOS/Windows, the actual host IP is not directly accessible
-            # We need to rely on environment variable or manual configuration
-            # But we can try to get it from the host system if possible
-            
-            # Check if there's a way to get host IP from the host system
-            # In Docker Desktop, we can try to use host.docker.internal
-            # But that resolves to Docker Desktop's virtual IP, not the actual WiFi IP
-            
-        except Exception:
-            pass
-        
         # If we still don't have an IP and MQTT_BROKER_HOST is not set, log a warning
         # (If MQTT_BROKER_HOST was set, we would have returned it at the beginning of the function)
         if not os.environ.get("MQTT_BROKER_HOST"):
@@ -445,8 +337,8 @@ def get_mqtt_broker_host(request=None) -> str:
     4. Auto-detect from local IP
     """
     # Priority 1: If MQTT_BROKER_HOST environment variable is configured, use it directly (deployment-time config)
-    if settings.MQTT_BROKER_HOST:
-        return settings.MQTT_BROKER_HOST
+    if _CONFIGURED_BROKER_HOST:
+        return _CONFIGURED_BROKER_HOST
     
     # Priority 2: Check manual override from database (user manual configuration in UI)
     try:
@@ -461,16 +353,14 @@ def get_mqtt_broker_host(request=None) -> str:
     
     # Priority 3: If request object exists, try getting from request headers
     # But exclude Docker gateway IPs (172.17.x.x, 172.18.x.x, etc.) to avoid incorrect detection
-    container_ip_ranges = ["172.17.", "172.18.", "172.19.", "172.20.", "172.21.", "172.22.", "172.23.", "172.24.", "172.25.", "172.26.", "172.27.", "172.28.", "172.29.", "172.30.", "172.31."]
-    
     if request:
         # Priority 3.1: Try to get from X-Forwarded-Host (reverse proxy scenario, most reliable)
         forwarded_host = request.headers.get("X-Forwarded-Host", "")
         if forwarded_host:
             host_without_port = forwarded_host.split(":")[0]
             # Exclude localhost, container IPs, and Docker gateway IPs
-            if (host_without_port not in ["localhost", "127.0.0.1", "0.0.0.0"] and 
-                not any(host_without_port.startswith(prefix) for prefix in container_ip_ranges)):
+            if (host_without_port not in _LOCAL_HOSTS and 
+                not _is_docker_ip(host_without_port)):
                 return host_without_port
         
         # Priority 3.2: Try to get from Host header
@@ -479,32 +369,31 @@ def get_mqtt_broker_host(request=None) -> str:
             # Remove port number (if exists)
             host_without_port = host.split(":")[0]
             # Exclude localhost, container IPs, and Docker gateway IPs
-            if (host_without_port not in ["localhost", "127.0.0.1", "0.0.0.0"] and 
-                not any(host_without_port.startswith(prefix) for prefix in container_ip_ranges)):
+            if (host_without_port not in _LOCAL_HOSTS and 
+                not _is_docker_ip(host_without_port)):
                 return host_without_port
         
         # Priority 3.3: Try to get from X-Real-IP (some reverse proxy settings)
         real_ip = request.headers.get("X-Real-IP", "")
         if real_ip:
             # Exclude localhost, container IPs, and Docker gateway IPs
-            if (real_ip not in ["localhost", "127.0.0.1", "0.0.0.0"] and 
-                not any(real_ip.startswith(prefix) for prefix in container_ip_ranges)):
+            if (real_ip not in _LOCAL_HOSTS and 
+                not _is_docker_ip(real_ip)):
                 return real_ip
     
-    # Priority 4: Try to get from environment variables (Docker Compose might set, or manual config)
-    host_ip = os.environ.get("HOST_IP") or os.environ.get("HOSTIP") or os.environ.get("MQTT_BROKER_HOST") or os.environ.get("SERVER_IP")
-    if host_ip:
-        try:
-            socket.inet_aton(host_ip)
-            return host_ip
-        except:
-            pass
-    
-    # Priority 5: Auto-detect from local IP (improved detection for Docker environments)
-    local_ip = get_local_ip()
+    # Priority 4/5: Environment variables or auto-detected local IP (fixed for the process lifetime, cached)
+    return _detect_broker_host()
+
+
+@lru_cache(maxsize=1)
+def _detect_broker_host() -> str:
+    """Broker host from environment variables, falling back to the detected local IP"""
+    # Try to get from environment variables (Docker Compose might set, or manual config)
+    if _HOST_IP_ENV:
+        return _HOST_IP_ENV
     
-    # Return detected IP (get_local_ip already prefers returning non-container IP)
-    return local_ip
+    # Auto-detect from local IP (get_local_ip already prefers returning non-container IP)
+    return get_local_ip()
 
 
 class Settings(BaseSettings):
@@ -514,6 +403,7 @@ class Settings(BaseSettings):
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     DEBUG: bool = True
+    CORS_ORIGINS: str = "*"  # Comma-separated allowed origins for CORS ("*" allows any origin, without credentials)
     
     # MQTT configuration
     MQTT_ENABLED: bool = True  # Whether to enable MQTT service
@@ -527,9 +417,13 @@ class Settings(BaseSettings):
     MQTT_UPLOAD_TOPIC: str = "annotator/upload/+"
     MQTT_RESPONSE_TOPIC_PREFIX: str = "annotator/response"
     MQTT_QOS: int = 1
+    MQTT_WORKERS: int = 4  # Worker lanes processing uploaded images (off the MQTT network thread; one device per lane)
+    MQTT_BATCH_SIZE: int = 32  # Max uploaded images committed to the database in one transaction
+    MQTT_BATCH_MS: int = 20  # How long a commit waits for concurrent uploads to join the batch
+    MQTT_SHARED_GROUP: str = ""  # Shared subscription group for upload topics, lets several instances split uploads (empty = normal subscription)
     
     # Database configuration
-    DATABASE_URL: str = f"sqlite:///{BASE_DIR}/data/annotator.db"
+    DATABASE_URL: str = f"sqlite:///{BASE_DIR_STR}/data/annotator.db"
     
     # File storage configuration
     DATASETS_ROOT: Path = DATASETS_DIR
@@ -552,11 +446,18 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
+# CORS allowed origins, parsed once at startup
+CORS_ALLOWED_ORIGINS = frozenset(o.strip() for o in settings.CORS_ORIGINS.split(",") if o.strip())
+
+# Deployment-time broker host override, resolved once (checked on every get_mqtt_broker_host call)
+_CONFIGURED_BROKER_HOST = settings.MQTT_BROKER_HOST
+
 # If MQTT_BROKER is empty, use local IP
 if not settings.MQTT_BROKER:
     settings.MQTT_BROKER = get_local_ip()
 
-# Ensure necessary directories exist
-settings.DATASETS_ROOT.mkdir(parents=True, exist_ok=True)
-(BASE_DIR / "data").mkdir(parents=True, exist_ok=True)
+# Ensure necessary directories exist (isdir short-circuits the mkdir on reloads)
+for _required_dir in (settings.DATASETS_ROOT, DATA_DIR):
+    if not os.path.isdir(_required_dir):
+        _required_dir.mkdir(parents=True, exist_ok=True)
 
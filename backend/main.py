@@ -1,13 +1,18 @@
 """Backend main entry point"""
+import asyncio
+import atexit
 import os
 import logging
+import logging.handlers
+import queue
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from pathlib import Path
-from backend.config import settings
+from backend.config import settings, CORS_ALLOWED_ORIGINS
 from backend.models.database import init_db
 from backend.api import routes
 from backend.services.mqtt_service import mqtt_service
@@ -26,18 +31,50 @@ logging.basicConfig(
 logging.getLogger("backend.services.mqtt_service").setLevel(log_level)
 logging.getLogger("backend.api.routes").setLevel(log_level)
 
+
+def _start_queue_logging() -> logging.handlers.QueueListener:
+    """Move the root handlers behind a queue, so logging calls only enqueue and a background thread does the I/O"""
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    log_queue = queue.SimpleQueue()
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Flush queued records on interpreter exit
+    atexit.register(listener.stop)
+    return listener
+
+
+log_listener = _start_queue_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown (see startup_event / shutdown_event)"""
+    await startup_event()
+    try:
+        yield
+    finally:
+        await shutdown_event()
+
+
 # Create FastAPI application
 app = FastAPI(
     title="CamThink AI Tool Stack API",
     description="Provide various AI toolsets to accelerate AI edge deployment",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Configure CORS
+# Configure CORS (set CORS_ORIGINS to restrict to specific domains in production).
+# Credentialed requests (cookies, auth headers) are only allowed for an explicit origin list,
+# never together with the "*" wildcard.
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # In production, restrict to specific domains
-    allow_credentials=True,
+    allow_origins=sorted(CORS_ALLOWED_ORIGINS),
+    allow_origin_regex=None,
+    allow_credentials="*" not in CORS_ALLOWED_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
 )
@@ -73,11 +110,14 @@ async def websocket_endpoint(websocket: WebSocket, project_id: str):
     await websocket_manager.connect(websocket, project_id)
     
     try:
-        while True:
-            data = await websocket.receive_text()
+        # Raw receive(): incoming frames are not decoded since they are unused
+        while (await websocket.receive())["type"] != "websocket.disconnect":
             # Client messages can be handled here
             # For example: sync annotation operations, real-time collaboration, etc.
+            pass
     except WebSocketDisconnect:
+        pass
+    finally:
         websocket_manager.disconnect(websocket, project_id)
 
 @app.websocket("/ws/devices")
@@ -86,10 +126,12 @@ async def device_websocket_endpoint(websocket: WebSocket):
     await websocket_manager.connect_device_listener(websocket)
     
     try:
-        while True:
-            data = await websocket.receive_text()
+        while (await websocket.receive())["type"] != "websocket.disconnect":
             # Client messages can be handled here if needed
+            pass
     except WebSocketDisconnect:
+        pass
+    finally:
         websocket_manager.disconnect_device_listener(websocket)
 
 # Register health check endpoint BEFORE catch-all route
@@ -136,16 +178,8 @@ if FRONTEND_BUILD_DIR.exists():
         raise HTTPException(status_code=404, detail="Frontend not found")
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize on application startup"""
-    print("[Server] Starting CamThink AI Tool Stack backend...")
-
-    # Initialize database
-    init_db()
-    print("[Server] Database initialized")
-
-    # Initialize NE301 project (auto-download and update if needed)
+def _init_ne301_project():
+    """Initialize NE301 project (auto-download and update if needed)"""
     try:
         from backend.utils.ne301_init import ensure_ne301_project
         from backend.utils.ne301_update import ensure_ne301_updated
@@ -179,8 +213,10 @@ async def startup_event():
     except Exception as e:
         print(f"[Server] Failed to initialize NE301 project: {e}")
         print("[Server] NE301 model compilation may not work. Continuing...")
-    
-    # Start MQTT service (if enabled)
+
+
+def _start_mqtt():
+    """Start MQTT service (if enabled)"""
     if settings.MQTT_ENABLED:
         # If using built-in Broker, start it first
         if settings.MQTT_USE_BUILTIN_BROKER:
@@ -203,7 +239,21 @@ async def startup_event():
         print("[Server] MQTT service is disabled")
 
 
-@app.on_event("shutdown")
+async def startup_event():
+    """Initialize on application startup"""
+    print("[Server] Starting CamThink AI Tool Stack backend...")
+
+    # Initialize database (off the event loop; MQTT reads its settings from it)
+    await asyncio.to_thread(init_db)
+    print("[Server] Database initialized")
+
+    # NE301 git checkout/update and MQTT startup are independent, run them in parallel
+    await asyncio.gather(
+        asyncio.to_thread(_init_ne301_project),
+        asyncio.to_thread(_start_mqtt)
+    )
+
+
 async def shutdown_event():
     """Cleanup on application shutdown"""
     print("[Server] Shutting down...")
@@ -230,9 +280,15 @@ def api_info():
 
 
 if __name__ == "__main__":
+    # Single worker: the MQTT service, built-in broker and WebSocket connections live in this process.
+    # uvloop/httptools come with uvicorn[standard] (not available on Windows, where "auto" falls back).
+    native = os.name != "nt"
     uvicorn.run(
         "backend.main:app",
         host=settings.HOST,
         port=settings.PORT,
-        reload=settings.DEBUG
+        reload=settings.DEBUG,
+        loop="uvloop" if native else "auto",
+        http="httptools" if native else "auto",
+        workers=1
     )
@@ -1,12 +1,33 @@
 """Database model definitions"""
-from sqlalchemy import create_engine, Column, Integer, String, Float, Text, DateTime, Boolean, ForeignKey, Table
+from sqlalchemy import create_engine, make_url, Column, Integer, String, Float, Text, DateTime, Boolean, ForeignKey, Table, Index, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
 from backend.config import settings
+from backend.utils.json_utils import json_dumps, json_loads
 
 Base = declarative_base()
-engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
+
+_database_url = make_url(settings.DATABASE_URL)
+_engine_options = {}
+if not (_database_url.get_backend_name() == "sqlite" and _database_url.database in (None, "", ":memory:")):
+    # Connection pool sized for the API threadpool plus the MQTT upload workers, so sessions reuse
+    # open connections instead of queueing for one or opening new ones under burst load
+    # (in-memory SQLite uses a SingletonThreadPool, which takes no size options)
+    _engine_options.update(pool_size=max(8, settings.MQTT_WORKERS * 2), max_overflow=16)
+if not settings.DATABASE_URL.startswith("sqlite"):
+    # Networked databases: detect connections dropped by the server and recycle stale ones
+    # (not needed for SQLite files, where the pre-ping would only add a query per checkout)
+    _engine_options.update(pool_pre_ping=True, pool_recycle=1800)
+
+engine = create_engine(
+    settings.DATABASE_URL,
+    connect_args={"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {},
+    # Used by JSON columns (orjson when available)
+    json_serializer=json_dumps,
+    json_deserializer=json_loads,
+    **_engine_options,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -49,6 +70,11 @@ class Image(Base):
     project = relationship("Project", back_populates="images")
     annotations = relationship("Annotation", back_populates="image", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Serves list_images: filter by project ordered by created_at without a sort step
+        Index("ix_images_project_created", "project_id", "created_at"),
+    )
+
 
 class Class(Base):
     """Class table"""
@@ -77,11 +103,12 @@ class Annotation(Base):
     # Annotation type: bbox, polygon, keypoint
     type = Column(String, nullable=False)
     
-    # Annotation data (stored in JSON format)
+    # Annotation data (JSON column, (de)serialized by SQLAlchemy; stored as TEXT on SQLite so
+    # rows written by earlier versions as JSON strings read back unchanged)
     # bbox: {"x_min": float, "y_min": float, "x_max": float, "y_max": float}
     # polygon: {"points": [[x, y], ...]}
     # keypoint: {"points": [[x, y, index], ...], "skeleton": [[i, j], ...]}
-    data = Column(Text, nullable=False)
+    data = Column(JSON, nullable=False)
     
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -90,6 +117,11 @@ class Annotation(Base):
     image = relationship("Image", back_populates="annotations")
     class_ = relationship("Class", back_populates="annotations")
 
+    __table_args__ = (
+        # Serves per-image annotation lookups (image detail, delete, exports)
+        Index("ix_annotations_image", "image_id"),
+    )
+
 
 class TrainingRecord(Base):
     """Training record table"""
@@ -360,11 +392,26 @@ def migrate_mqtt_settings():
         logger.info("[DB Migration] No new columns needed for mqtt_settings table")
 
 
+def migrate_indexes():
+    """Create indexes added after the initial schema on existing tables"""
+    import logging
+    
+    logger = logging.getLogger(__name__)
+    
+    for index in (*Image.__table__.indexes, *Annotation.__table__.indexes):
+        try:
+            # checkfirst skips indexes that already exist (e.g. fresh databases from create_all)
+            index.create(bind=engine, checkfirst=True)
+        except Exception as e:
+            logger.warning(f"[DB Migration] Could not create index {index.name}: {e}")
+
+
 def init_db():
     """Initialize database, create all tables"""
     Base.metadata.create_all(bind=engine)
     # Run migration for existing tables
     migrate_mqtt_settings()
+    migrate_indexes()
 
 
 def get_db():
@@ -1,7 +1,10 @@
 """MQTT service: subscribe to images uploaded by devices"""
 import json
 import base64
+import binascii
+import os
 import re
+import socket
 import uuid
 import logging
 import time
@@ -10,6 +13,8 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Optional
 from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
 import paho.mqtt.client as mqtt
 from PIL import Image as PILImage
 import io
@@ -22,9 +27,193 @@ from sqlalchemy.orm import joinedload
 from backend.services.mqtt_broker import builtin_mqtt_broker
 from backend.services.mqtt_config_service import MQTTConfig, mqtt_config_service
 from backend.services.external_broker_service import external_broker_service
+from backend.utils.json_utils import json_loads, json_dumps_bytes
+from backend.utils.image_size import fast_image_size
 
 logger = logging.getLogger(__name__)
 
+try:
+    import pybase64
+    HAS_PYBASE64 = True
+except ImportError:
+    HAS_PYBASE64 = False
+    logger.warning("[MQTT Service] pybase64 not installed. Image payloads will be decoded with the slower stdlib base64: pip install pybase64")
+
+
+def _subscription_topic(topic: str) -> str:
+    """Subscription filter for an upload topic, as a shared subscription when MQTT_SHARED_GROUP is set
+
+    Each message on a shared subscription is delivered to only one subscriber of the
+    group, so several instances connected to the same broker split the uploads.
+    """
+    if settings.MQTT_SHARED_GROUP:
+        return f"$share/{settings.MQTT_SHARED_GROUP}/{topic}"
+    return topic
+
+
+@lru_cache(maxsize=1024)
+def _response_topic(device_id: str) -> str:
+    """Response topic for a device (built once per device instead of per published response)"""
+    return f"{settings.MQTT_RESPONSE_TOPIC_PREFIX}/{device_id}"
+
+
+# Upper bound for a message payload: a base64-encoded image of MAX_IMAGE_SIZE_MB (4/3 expansion)
+# plus room for metadata/device info. The exact decoded size is checked in _handle_image_upload.
+_MAX_PAYLOAD_BYTES = settings.MAX_IMAGE_SIZE_MB * 1024 * 1024 * 4 // 3 + 1024 * 1024
+
+# Human-readable on_connect result codes
+_CONNECT_ERROR_MESSAGES = {
+    1: "Connection refused - incorrect protocol version",
+    2: "Connection refused - invalid client identifier",
+    3: "Connection refused - server unavailable",
+    4: "Connection refused - bad username or password",
+    5: "Connection refused - not authorized",
+    142: "Session taken over - another client with the same client ID is already connected. Use a unique client ID or ensure old connection is properly closed."
+}
+
+# Human-readable on_disconnect codes (0 = normal disconnect, non-zero = unexpected: network error, timeout, etc.)
+_DISCONNECT_ERROR_MESSAGES = {
+    0: "Normal disconnect",
+    7: "Network error or timeout - connection may have timed out",
+    142: "Session taken over - another client with the same client ID connected. This is normal MQTT behavior when using duplicate client IDs."
+}
+
+
+# Attempts at finding a free filename before an upload is rejected
+_FILENAME_ATTEMPTS = 3
+
+
+def _write_once(path: Path, data: bytes):
+    """Create a new file that won't be read back soon, without keeping it in the page cache
+
+    Raises FileExistsError if path already exists (checked atomically by the open).
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+# How long an upload waits for its row to be committed before answering with an error
+_IMAGE_INSERT_TIMEOUT_S = 30
+
+
+class _ImageBatchWriter:
+    """Group commit for images received over MQTT
+
+    Upload workers hand over their Image row and block until it is committed.
+    Rows arriving within MQTT_BATCH_MS of each other (up to MQTT_BATCH_SIZE)
+    are inserted by a single flusher thread in one transaction, so a burst of
+    uploads costs one commit (one fsync) instead of one per image. Devices are
+    still only answered after their row is committed.
+    """
+    
+    def __init__(self, max_batch: int, max_delay_ms: int):
+        self._max_batch = max(1, max_batch)
+        self._max_delay = max(0, max_delay_ms) / 1000
+        self._cond = threading.Condition()
+        self._pending: list[tuple[dict, Future]] = []
+        self._thread: Optional[threading.Thread] = None
+    
+    def insert(self, row: dict) -> int:
+        """Queue an Image row (column values) and wait until it is committed; returns the image id
+
+        Raises the commit error, or TimeoutError when the row wasn't picked up within
+        _IMAGE_INSERT_TIMEOUT_S (it is then dropped). A row the flusher is already
+        committing is waited for, so a late commit is never reported as a failure.
+        """
+        future = Future()
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="mqtt-image-writer", daemon=True)
+                self._thread.start()
+            self._pending.append((row, future))
+            self._cond.notify()
+        try:
+            return future.result(timeout=_IMAGE_INSERT_TIMEOUT_S)
+        except FutureTimeoutError:
+            if not future.cancel():
+                # Already being committed: the flusher resolves every future it picks up
+                return future.result()
+            raise TimeoutError(f"Image was not committed within {_IMAGE_INSERT_TIMEOUT_S}s")
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Give concurrent uploads a short window to join this batch
+                deadline = time.monotonic() + self._max_delay
+                while len(self._pending) < self._max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self._max_batch]
+                del self._pending[:self._max_batch]
+            try:
+                self._flush(batch)
+            except Exception as e:
+                # Never let the flusher die: uploads waiting on this batch get the error
+                logger.error(f"MQTT image batch flush failed: {e}", exc_info=True)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+    
+    def _flush(self, batch: list[tuple[dict, Future]]):
+        # Skip rows whose upload already gave up waiting
+        batch = [(row, future) for row, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        
+        try:
+            image_ids = self._commit([row for row, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # Retry one by one so only the offending upload gets the error
+            logger.warning(f"Committing {len(batch)} MQTT images in one transaction failed ({e}), retrying one by one")
+            for row, future in batch:
+                try:
+                    future.set_result(self._commit([row])[0])
+                except Exception as row_error:
+                    future.set_exception(row_error)
+            return
+        
+        logger.debug(f"Committed {len(batch)} MQTT image(s) in one transaction")
+        for (_, future), image_id in zip(batch, image_ids):
+            future.set_result(image_id)
+    
+    @staticmethod
+    def _commit(rows: list[dict]) -> list[int]:
+        """Insert Image rows in one transaction, return their ids"""
+        db = SessionLocal()
+        try:
+            images = [Image(**row) for row in rows]
+            db.add_all(images)
+            db.flush()
+            image_ids = [image.id for image in images]
+            db.commit()
+            return image_ids
+        except Exception:
+            try:
+                db.rollback()
+            except Exception as rollback_error:
+                logger.warning(f"Rollback after failed MQTT image commit failed: {rollback_error}")
+            raise
+        finally:
+            try:
+                db.close()
+            except Exception as close_error:
+                logger.warning(f"Closing MQTT image session failed: {close_error}")
+
 
 class MQTTService:
     """MQTT subscription service"""
@@ -64,6 +253,22 @@ class MQTTService:
         self._dedup_cleanup_interval = 3600  # 1 hour in seconds
         self._dedup_lock = threading.Lock()  # Lock for thread-safe deduplication
         
+        # Upload/uplink handlers run off the paho network loop so it never blocks on
+        # decode/disk/DB work (which caused keepalive timeouts). Each device is pinned to one
+        # single-thread lane, so its messages are still handled in order and one at a time
+        # (no racing device upserts). In-flight work is bounded by a semaphore; when it's
+        # exhausted new messages are rejected with a "busy" response.
+        self._device_lanes: list[ThreadPoolExecutor] = []
+        self._upload_slots = threading.BoundedSemaphore(settings.MQTT_WORKERS * 4)
+        self._image_writer = _ImageBatchWriter(settings.MQTT_BATCH_SIZE, settings.MQTT_BATCH_MS)
+        
+        # Project ids recently verified to exist: {project_id: verified_at (monotonic)}
+        # Skips the per-message SELECT; entries expire after _project_cache_ttl and are
+        # dropped immediately when a project is deleted (see invalidate_project)
+        self._project_cache: dict[str, float] = {}
+        self._project_cache_ttl = 60.0
+        self._project_cache_lock = threading.Lock()
+        
         # Device status check timer (periodic task to mark offline devices)
         self._status_check_timer: Optional[threading.Timer] = None
         self._status_check_interval = 60  # Check every 60 seconds
@@ -108,7 +313,7 @@ class MQTTService:
                 self._endpoints[broker_index]["connected"] = True
             logger.info(f"Connected to broker at {broker_host}:{broker_port}")
             # Subscribe to image upload topic pattern (project-based uploads)
-            upload_topic_pattern = getattr(client, "_camthink_topic_pattern", settings.MQTT_UPLOAD_TOPIC)
+            upload_topic_pattern = _subscription_topic(getattr(client, "_camthink_topic_pattern", settings.MQTT_UPLOAD_TOPIC))
             broker_qos = getattr(client, "_camthink_broker_qos", settings.MQTT_QOS)
             try:
                 result = client.subscribe(upload_topic_pattern, qos=broker_qos)
@@ -122,7 +327,7 @@ class MQTTService:
             # Subscribe to device uplink topic for unified device-side reporting
             try:
                 # Unified uplink: device/{device_id}/uplink
-                device_uplink_topic = "device/+/uplink"
+                device_uplink_topic = _subscription_topic("device/+/uplink")
                 result = client.subscribe(device_uplink_topic, qos=broker_qos)
                 if result[0] == mqtt.MQTT_ERR_SUCCESS:
                     logger.info(f"Subscribed to device uplink topic pattern: {device_uplink_topic} (QoS: {broker_qos})")
@@ -163,6 +368,14 @@ class MQTTService:
                 'message': error_msg
             })
     
+    def on_socket_open(self, client, userdata, sock):
+        """Socket open callback (also on reconnect): disable Nagle so small response packets aren't delayed"""
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (OSError, AttributeError):
+            # WebSocket transport wrapper has no setsockopt
+            pass
+    
     def on_disconnect(self, client, userdata, rc):
         """Disconnect callback"""
         broker_index = getattr(client, "_camthink_broker_index", None)
@@ -226,33 +439,32 @@ class MQTTService:
             self.last_message_time = time.time()
             
             topic = msg.topic
-            payload = msg.payload.decode('utf-8')
+            payload = msg.payload
+            
+            # Reject payloads that can't hold an allowed image before parsing them
+            if len(payload) > _MAX_PAYLOAD_BYTES:
+                logger.warning(f"Payload on topic {topic} too large: {len(payload) / (1024 * 1024):.2f}MB, dropping")
+                return
             
-            # Parse JSON payload
+            # Parse JSON payload straight from the raw bytes (no intermediate str copy of large image payloads)
             try:
-                data = json.loads(payload)
+                data = json_loads(payload)
             except json.JSONDecodeError as e:
                 logger.error(f"JSON decode error for topic {topic}: {e}")
-                # Try to extract req_id and device_id from raw payload
-                req_id = ''
-                device_id = ''
-                try:
-                    temp_data = json.loads(payload)  # This will fail, but we try
-                except Exception:
-                    pass
-                self._send_error_response(client, req_id, device_id, "Invalid JSON format")
+                # req_id and device_id can't be extracted from an unparseable payload
+                self._send_error_response(client, '', '', "Invalid JSON format")
                 return
             
             # Handle MQTT broker SYS topics for device connection tracking
             if topic.startswith("$SYS/"):
-                self._handle_sys_topic_message(topic, payload)
+                self._handle_sys_topic_message(topic, payload.decode('utf-8', errors='replace'))
                 return
 
             # Route by topic:
             # - annotator/upload/{project_id}: generic project-based upload (existing behavior)
             # - device/{device_id}/uplink: unified device uplink (status/image/AI result, etc.)
             if topic.startswith("annotator/upload/"):
-                parts = topic.split('/')
+                parts = topic.split('/', 3)
                 if len(parts) < 3:
                     logger.warning(f"Invalid upload topic format: {topic}")
                     return
@@ -262,10 +474,11 @@ class MQTTService:
                 data = self._normalize_payload(data, topic)
 
                 # Handle image upload directly to specified project
-                self._handle_image_upload(client, project_id, data, topic)
+                lane_key = data.get('device_id') if isinstance(data, dict) else None
+                self._dispatch(client, self._handle_image_upload, project_id, data, topic, lane_key or project_id)
 
             elif topic.startswith("device/"):
-                parts = topic.split('/')
+                parts = topic.split('/', 3)
                 if len(parts) < 3:
                     logger.warning(f"Invalid device topic format: {topic}")
                     return
@@ -277,7 +490,7 @@ class MQTTService:
                     logger.info(f"Received device uplink message from {device_id_from_topic} on topic {topic}")
                     if isinstance(data, dict):
                         logger.debug(f"Device uplink payload keys: {list(data.keys())}, has image_data: {'image_data' in data}, has device_info: {isinstance(data.get('device_info'), dict)}")
-                    self._handle_device_uplink_message(client, device_id_from_topic, data, topic)
+                    self._dispatch(client, self._handle_device_uplink_message, device_id_from_topic, data, topic, device_id_from_topic)
                 else:
                     logger.warning(f"Unknown device sub-topic '{sub_topic}' in topic {topic}")
 
@@ -289,13 +502,61 @@ class MQTTService:
             req_id = ''
             device_id = ''
             try:
-                data = json.loads(msg.payload.decode('utf-8'))
+                data = json_loads(msg.payload)
                 req_id = data.get('req_id', '')
                 device_id = data.get('device_id', '')
             except:
                 pass
             self._send_error_response(client, req_id, device_id, str(e))
     
+    def _dispatch(self, client, handler, target_id: str, data: dict, topic: str, lane_key: str):
+        """Queue a message handler on the lane of lane_key (returns immediately)
+
+        Messages with the same lane_key (the device id) always land on the same
+        single-thread lane, so they're handled one at a time in arrival order.
+        """
+        req_id = data.get('req_id', '') if isinstance(data, dict) else ''
+        device_id = data.get('device_id', '') if isinstance(data, dict) else ''
+        lanes = self._device_lanes
+        if not lanes or not self._upload_slots.acquire(blocking=False):
+            logger.warning(f"Upload workers saturated, rejecting message on topic {topic}")
+            self._send_error_response(client, req_id, device_id, "Server busy, please retry later")
+            return
+        try:
+            lanes[hash(lane_key) % len(lanes)].submit(self._run_handler, client, handler, target_id, data, topic, req_id, device_id)
+        except RuntimeError:
+            # Executor was shut down concurrently (service stopping)
+            self._upload_slots.release()
+            self._send_error_response(client, req_id, device_id, "Server is stopping")
+    
+    def _run_handler(self, client, handler, target_id: str, data: dict, topic: str, req_id: str, device_id: str):
+        """Device lane entry point for a message handler"""
+        try:
+            handler(client, target_id, data, topic)
+        except Exception as e:
+            logger.error(f"Error processing message: {e}", exc_info=True)
+            self._send_error_response(client, req_id, device_id, str(e))
+        finally:
+            self._upload_slots.release()
+    
+    def _project_exists(self, db, project_id: str) -> bool:
+        """Whether a project exists (cached for _project_cache_ttl seconds)"""
+        now = time.monotonic()
+        with self._project_cache_lock:
+            verified_at = self._project_cache.get(project_id)
+        if verified_at is not None and now - verified_at < self._project_cache_ttl:
+            return True
+        exists = db.query(Project.id).filter(Project.id == project_id).first() is not None
+        if exists:
+            with self._project_cache_lock:
+                self._project_cache[project_id] = now
+        return exists
+    
+    def invalidate_project(self, project_id: str):
+        """Forget a cached project (call when a project is deleted)"""
+        with self._project_cache_lock:
+            self._project_cache.pop(project_id, None)
+    
     def _get_message_id(self, data: dict, topic: str) -> str:
         """Generate a unique message ID for deduplication.
         
@@ -306,8 +567,7 @@ class MQTTService:
         """
         # Create a hash based on the full content to ensure different data = different ID
         # Sort keys to ensure consistent hashing
-        content_str = json.dumps(data, sort_keys=True)
-        content_hash = hashlib.md5(content_str.encode()).hexdigest()
+        content_hash = hashlib.md5(json_dumps_bytes(data, sort_keys=True)).hexdigest()
         
         # Include device_id and topic for additional context
         device_id = data.get('device_id', 'unknown')
@@ -381,7 +641,7 @@ class MQTTService:
                 values = data["values"]
                 ts = data.get("ts")
                 # Choose device id: SN > MAC > topic suffix
-                device_id = values.get("devSn") or values.get("devMac") or (topic.split("/")[-1] if "/" in topic else "unknown")
+                device_id = values.get("devSn") or values.get("devMac") or (topic.rpartition("/")[2] if "/" in topic else "unknown")
 
                 # Standardized device_info section
                 device_info = {
@@ -430,7 +690,7 @@ class MQTTService:
                         device_info.get("serial_number")
                         or device_info.get("mac_address")
                         or device_info.get("device_name")
-                        or (topic.split("/")[-1] if "/" in topic else "unknown")
+                        or (topic.rpartition("/")[2] if "/" in topic else "unknown")
                     )
                     data["device_id"] = device_id
                 
@@ -458,7 +718,7 @@ class MQTTService:
             if "image" in data and data.get("image"):
                 # Ensure device_id is set
                 if not data.get("device_id"):
-                    device_id = topic.split("/")[-1] if "/" in topic else "unknown"
+                    device_id = topic.rpartition("/")[2] if "/" in topic else "unknown"
                     data["device_id"] = device_id
                 
                 # Convert "image" to "image_data" for consistency
@@ -495,7 +755,7 @@ class MQTTService:
 
         # Default: return original data, but ensure device_id is set
         if isinstance(data, dict) and not data.get("device_id"):
-            device_id = topic.split("/")[-1] if "/" in topic else "unknown"
+            device_id = topic.rpartition("/")[2] if "/" in topic else "unknown"
             data["device_id"] = device_id
             logger.debug(f"Set default device_id for unnormalized payload: {device_id}")
         
@@ -740,6 +1000,8 @@ class MQTTService:
     def _handle_image_upload(self, client, project_id: str, data: dict, topic: str):
         """Handle image upload"""
         logger.info(f"Processing image upload for project {project_id}, device {data.get('device_id', 'unknown')}")
+        # Server time (epoch seconds) for defaults and responses of this message
+        now = int(time.time())
         
         # Check for duplicate messages to prevent processing the same image multiple times
         # This can happen when multiple MQTT clients subscribe to the same topic
@@ -758,7 +1020,7 @@ class MQTTService:
             # Still send success response to avoid device retries
             req_id = data.get('req_id', '')
             device_id = data.get('device_id', 'unknown')
-            self._send_success_response(client, req_id, device_id, project_id)
+            self._send_success_response(client, req_id, device_id, project_id, server_time=now)
             return
         
         logger.debug(f"Processing image upload for project {project_id} (message_id: {project_specific_message_id[:50]}...)")
@@ -772,7 +1034,7 @@ class MQTTService:
         if 'image_data' in data:
             # New format
             req_id = data.get('req_id', str(uuid.uuid4()))
-            device_id = data.get('device_id', topic.split('/')[-1] if '/' in topic else 'unknown')
+            device_id = data.get('device_id', topic.rpartition('/')[2] if '/' in topic else 'unknown')
             metadata = data.get('metadata', {})
             encoding = data.get('encoding', 'base64')
             base64_data = data.get('image_data', '')
@@ -780,12 +1042,12 @@ class MQTTService:
             if not base64_data:
                 error_msg = "image_data field is empty"
                 logger.error(f"{error_msg} for project {project_id}, device {device_id}")
-                self._send_error_response(client, req_id, device_id, error_msg)
+                self._send_error_response(client, req_id, device_id, error_msg, server_time=now)
                 return
             
             # Extract information from metadata
-            image_id = metadata.get('image_id', f'img_{int(datetime.utcnow().timestamp())}')
-            timestamp = metadata.get('timestamp', int(datetime.utcnow().timestamp()))
+            image_id = metadata.get('image_id', f'img_{now}')
+            timestamp = metadata.get('timestamp', now)
             image_format = metadata.get('format', 'jpeg').lower()
             # If metadata has dimension information, use it first
             metadata_width = metadata.get('width')
@@ -796,7 +1058,7 @@ class MQTTService:
             # Old format (backward compatible)
             req_id = data.get('req_id', str(uuid.uuid4()))
             device_id = data.get('device_id', 'unknown')
-            timestamp = data.get('timestamp', int(datetime.utcnow().timestamp()))
+            timestamp = data.get('timestamp', now)
             image_data = data.get('image', {})
             metadata = data.get('metadata', {})
             
@@ -809,11 +1071,10 @@ class MQTTService:
         # Verify project exists & fetch device name (for filename)
         db = SessionLocal()
         try:
-            project = db.query(Project).filter(Project.id == project_id).first()
-            if not project:
+            if not self._project_exists(db, project_id):
                 error_msg = f"Project {project_id} not found"
                 logger.warning(error_msg)
-                self._send_error_response(client, req_id, device_id, error_msg)
+                self._send_error_response(client, req_id, device_id, error_msg, server_time=now)
                 return
 
             # Build filename: deviceId_deviceName_timestamp.ext
@@ -838,6 +1099,10 @@ class MQTTService:
             # Sanitize device_name for filesystem (English only, no spaces/special chars)
             safe_device_name = re.sub(r'[^A-Za-z0-9_\\-]+', '_', str(device_name))
 
+            # The session is only needed for the lookups above: return its connection to the
+            # pool now instead of holding it through decode, write and notifications
+            db.close()
+
             # Format timestamp as yyyyMMdd_HHmmss
             try:
                 # timestamp is in seconds
@@ -854,7 +1119,8 @@ class MQTTService:
             else:
                 ext = image_format
 
-            filename = f"{device_id}_{safe_device_name}_{ts_str}.{ext}"
+            base_name = f"{device_id}_{safe_device_name}_{ts_str}"
+            filename = f"{base_name}.{ext}"
             
             # Process base64 data, remove possible data URI prefix
             # Supported formats:
@@ -862,88 +1128,95 @@ class MQTTService:
             # 2. data:image/png;base64,xxxxx
             # 3. data:image/jpg;base64,xxxxx
             # 4. Pure base64 string
-            if base64_data.startswith('data:'):
-                # Contains data URI prefix, extract base64 part
-                if ',' in base64_data:
-                    base64_data = base64_data.split(',')[-1]
-                else:
-                    # If format is abnormal, try to remove data: prefix
-                    base64_data = base64_data.replace('data:', '').split(';')[-1]
-            elif ',' in base64_data:
-                # Might contain other separators
-                base64_data = base64_data.split(',')[-1]
-            
-            # Clean possible whitespace characters
-            base64_data = base64_data.strip()
-            
             # Base64 decode
             if encoding != 'base64':
                 raise ValueError(f"Unsupported encoding: {encoding}")
             
-            try:
-                image_bytes = base64.b64decode(base64_data)
-            except Exception as e:
-                raise ValueError(f"Failed to decode base64 data: {str(e)}")
+            # The decoder works on bytes, so the payload is encoded once and the base64 part is
+            # handed over as a memoryview (no sliced/stripped copies of a multi-MB string).
+            # Whitespace doesn't need stripping: non-alphabet characters are discarded when decoding.
+            raw = base64_data.encode('ascii')
+            start = raw.rfind(b',') + 1
+            if not start and raw.startswith(b'data:'):
+                # If format is abnormal, skip the data: prefix up to the last ';'
+                start = max(raw.rfind(b';') + 1, 5)
+            encoded = memoryview(raw)[start:]
             
-            # Verify image size
-            size_mb = len(image_bytes) / (1024 * 1024)
+            # Verify image size before decoding: the decoded size follows from the base64 length
+            # (line breaks and padding don't carry data), so oversized images are never materialized
+            tail = bytes(encoded[-4:])
+            encoded_len = len(encoded) - raw.count(b'\n', start) - raw.count(b'\r', start)
+            size_mb = (encoded_len * 3 // 4 - tail.rstrip()[-2:].count(b'=')) / (1024 * 1024)
             if size_mb > settings.MAX_IMAGE_SIZE_MB:
                 raise ValueError(f"Image too large: {size_mb:.2f}MB (max: {settings.MAX_IMAGE_SIZE_MB}MB)")
             
+            try:
+                if HAS_PYBASE64:
+                    # SIMD decoder, same handling of non-alphabet characters as base64.b64decode
+                    image_bytes = pybase64.b64decode(encoded, validate=False)
+                else:
+                    image_bytes = base64.b64decode(encoded)
+            except binascii.Error as e:
+                # Only malformed input (bad padding/length) can fail here
+                raise ValueError(f"Failed to decode base64 data: {str(e)}")
+            finally:
+                encoded.release()
+            
             # Get image dimensions
             if metadata_width and metadata_height:
                 # Use dimension information from metadata
                 img_width = metadata_width
                 img_height = metadata_height
             else:
-                # Open image to get dimensions
-                img = PILImage.open(io.BytesIO(image_bytes))
-                img_width, img_height = img.size
+                # Read dimensions from the JPEG/PNG header, open with PIL only for other formats
+                size = fast_image_size(image_bytes)
+                if size is None:
+                    img = PILImage.open(io.BytesIO(image_bytes))
+                    size = img.size
+                img_width, img_height = size
             
-            # Generate storage path
+            # Generate storage path (raw/ is created with the project)
             project_dir = settings.DATASETS_ROOT / project_id / "raw"
-            project_dir.mkdir(parents=True, exist_ok=True)
             
-            # Handle filename conflicts
+            # Save image (served later on demand, so not kept in the page cache).
+            # Filename conflicts are detected by the exclusive create itself (no exists() race),
+            # a random suffix is appended on conflict
             file_path = project_dir / filename
-            if file_path.exists():
-                stem = file_path.stem
-                suffix = file_path.suffix
-                timestamp_suffix = int(datetime.utcnow().timestamp())
-                filename = f"{stem}_{timestamp_suffix}{suffix}"
-                file_path = project_dir / filename
-            
-            # Save image
-            file_path.write_bytes(image_bytes)
+            for attempt in range(_FILENAME_ATTEMPTS):
+                try:
+                    _write_once(file_path, image_bytes)
+                    break
+                except FileExistsError:
+                    filename = f"{base_name}_{uuid.uuid4().hex[:8]}.{ext}"
+                    file_path = project_dir / filename
+                except FileNotFoundError:
+                    # raw/ missing (project created before it was made at creation time, or removed)
+                    project_dir.mkdir(parents=True, exist_ok=True)
+            else:
+                raise ValueError(f"Could not find a free filename for {base_name}.{ext}")
             
             # Generate relative path (only includes raw/filename, not project_id)
             relative_path = f"raw/{filename}"
             
-            # Save to database
-            db_image = Image(
-                project_id=project_id,
-                filename=filename,
-                path=relative_path,
-                width=img_width,
-                height=img_height,
-                status="UNLABELED",
-                source=f"MQTT:{device_id}"
-            )
-            db.add(db_image)
+            # Save to database (group-committed with concurrent uploads, returns once committed)
             logger.debug(f"Adding image to database: project_id={project_id}, filename={filename}, path={relative_path}, source=MQTT:{device_id}")
-            db.commit()
-            db.refresh(db_image)
-            
-            # Ensure database transaction is fully committed before notifying frontend
+            # The transaction is fully committed before the frontend is notified
             # This prevents frontend from refreshing before the new image is visible in the database
-            image_id = db_image.id
-            
-            # Verify image was saved by querying it back
-            verify_image = db.query(Image).filter(Image.id == image_id).first()
-            if verify_image:
-                logger.info(f"✓ Image saved and verified: {filename} ({img_width}x{img_height}) to project {project_id}, image_id: {image_id}, path: {relative_path}")
-            else:
-                logger.error(f"✗ Image save verification failed: image_id {image_id} not found in database after commit!")
+            try:
+                image_id = self._image_writer.insert({
+                    "project_id": project_id,
+                    "filename": filename,
+                    "path": relative_path,
+                    "width": img_width,
+                    "height": img_height,
+                    "status": "UNLABELED",
+                    "source": f"MQTT:{device_id}"
+                })
+            except Exception:
+                # No row references the file: remove it so the device's retry doesn't leave an orphan
+                file_path.unlink(missing_ok=True)
+                raise
+            logger.info(f"✓ Image saved: {filename} ({img_width}x{img_height}) to project {project_id}, image_id: {image_id}, path: {relative_path}")
 
             # Upsert device info based on payload (if device_id is known)
             try:
@@ -952,19 +1225,21 @@ class MQTTService:
                 logger.error(f"Failed to upsert device info for device_id={device_id}: {dev_err}", exc_info=True)
             
             # Send success response
-            self._send_success_response(client, req_id, device_id, project_id)
+            self._send_success_response(client, req_id, device_id, project_id, server_time=now)
             
             # Notify frontend via WebSocket (after database commit is complete)
+            # Non-blocking: the broadcast is handed to the WebSocket event loop
             try:
-                websocket_manager.broadcast_project_update(project_id, {
+                update = {
                     "type": "new_image",
                     "image_id": image_id,
                     "filename": filename,
                     "path": relative_path,
                     "width": img_width,
                     "height": img_height
-                })
-                logger.debug(f"WebSocket notification sent for new image {image_id} in project {project_id}")
+                }
+                websocket_manager.broadcast_project_update(project_id, update)
+                logger.debug(f"WebSocket notification queued for new image {image_id} in project {project_id}")
             except Exception as ws_error:
                 logger.error(f"Failed to send WebSocket notification for new image: {ws_error}", exc_info=True)
                 # Don't fail the whole operation if WebSocket notification fails
@@ -973,7 +1248,7 @@ class MQTTService:
             db.rollback()
             error_msg = f"Failed to save image: {str(e)}"
             logger.error(error_msg, exc_info=True)
-            self._send_error_response(client, req_id, device_id, error_msg)
+            self._send_error_response(client, req_id, device_id, error_msg, server_time=now)
             # Re-raise the exception so the caller knows the operation failed
             raise
         finally:
@@ -1028,6 +1303,10 @@ class MQTTService:
 
         now = datetime.utcnow()
 
+        # Serialize the report once: stored as last_report and as history, hashed as bytes
+        report_data_bytes = json_dumps_bytes(data, sort_keys=True)  # Sort keys for consistent comparison
+        report_data_str = report_data_bytes.decode('utf-8')
+
         db = SessionLocal()
         try:
             device = db.query(Device).filter(Device.id == device_id).first()
@@ -1048,7 +1327,7 @@ class MQTTService:
                     firmware_version=software_version,
                     hardware_version=hardware_version,
                     power_supply_type=power_supply_type,
-                    last_report=json.dumps(data),
+                    last_report=report_data_str,
                 )
                 db.add(device)
             else:
@@ -1094,13 +1373,12 @@ class MQTTService:
                 device.firmware_version = software_version or device.firmware_version
                 device.hardware_version = hardware_version or device.hardware_version
                 device.power_supply_type = power_supply_type or device.power_supply_type
-                device.last_report = json.dumps(data)
+                device.last_report = report_data_str
 
             # Save report to history (with deduplication check)
             # Only skip if the EXACT same content was saved recently (within last 10 seconds)
             # This allows different data from the same device to be saved normally
-            report_data_str = json.dumps(data, sort_keys=True)  # Sort keys for consistent comparison
-            report_hash = hashlib.md5(report_data_str.encode()).hexdigest()
+            report_hash = hashlib.md5(report_data_bytes).hexdigest()
             
             # Check for duplicate report with EXACT same content in the last 10 seconds
             recent_cutoff = now - timedelta(seconds=10)
@@ -1282,7 +1560,7 @@ class MQTTService:
         self._status_check_timer.daemon = True
         self._status_check_timer.start()
     
-    def _send_success_response(self, client, req_id: str, device_id: str, project_id: str):
+    def _send_success_response(self, client, req_id: str, device_id: str, project_id: str, server_time: Optional[int] = None):
         """Send success response"""
         if not device_id or device_id == 'unknown':
             return
@@ -1298,23 +1576,23 @@ class MQTTService:
         else:
             qos = settings.MQTT_QOS
         
-        response_topic = f"{settings.MQTT_RESPONSE_TOPIC_PREFIX}/{device_id}"
+        response_topic = _response_topic(device_id)
         response = {
             "req_id": req_id,
             "status": "success",
             "code": 200,
             "message": f"Image saved to project {project_id}",
-            "server_time": int(datetime.utcnow().timestamp())
+            "server_time": int(time.time()) if server_time is None else server_time
         }
         
         try:
-            result = client.publish(response_topic, json.dumps(response), qos=qos)
+            result = client.publish(response_topic, json_dumps_bytes(response), qos=qos)
             if result.rc != mqtt.MQTT_ERR_SUCCESS:
                 logger.warning(f"Failed to publish success response: error code {result.rc}")
         except Exception as e:
             logger.error(f"Error publishing success response: {e}")
     
-    def _send_error_response(self, client, req_id: str, device_id: str, error_message: str):
+    def _send_error_response(self, client, req_id: str, device_id: str, error_message: str, server_time: Optional[int] = None):
         """Send error response"""
         if not device_id or device_id == 'unknown':
             return
@@ -1330,17 +1608,17 @@ class MQTTService:
         else:
             qos = settings.MQTT_QOS
         
-        response_topic = f"{settings.MQTT_RESPONSE_TOPIC_PREFIX}/{device_id}"
+        response_topic = _response_topic(device_id)
         response = {
             "req_id": req_id,
             "status": "error",
             "code": 400,
             "message": error_message,
-            "server_time": int(datetime.utcnow().timestamp())
+            "server_time": int(time.time()) if server_time is None else server_time
         }
         
         try:
-            result = client.publish(response_topic, json.dumps(response), qos=qos)
+            result = client.publish(response_topic, json_dumps_bytes(response), qos=qos)
             if result.rc != mqtt.MQTT_ERR_SUCCESS:
                 logger.warning(f"Failed to publish error response: error code {result.rc}")
         except Exception as e:
@@ -1348,30 +1626,11 @@ class MQTTService:
     
     def _get_connection_error_message(self, rc: int) -> str:
         """Get human-readable connection error message"""
-        error_messages = {
-            1: "Connection refused - incorrect protocol version",
-            2: "Connection refused - invalid client identifier",
-            3: "Connection refused - server unavailable",
-            4: "Connection refused - bad username or password",
-            5: "Connection refused - not authorized",
-            142: "Session taken over - another client with the same client ID is already connected. Use a unique client ID or ensure old connection is properly closed."
-        }
-        return error_messages.get(rc, f"Unknown error code {rc}")
+        return _CONNECT_ERROR_MESSAGES.get(rc, f"Unknown error code {rc}")
     
     def _get_disconnect_error_message(self, rc: int) -> str:
         """Get human-readable disconnect error message"""
-        # rc values for on_disconnect:
-        # 0 = normal disconnect
-        # Non-zero = unexpected disconnect
-        # Common values: network error, timeout, etc.
-        if rc == 0:
-            return "Normal disconnect"
-        elif rc == 7:
-            return "Network error or timeout - connection may have timed out"
-        elif rc == 142:
-            return "Session taken over - another client with the same client ID connected. This is normal MQTT behavior when using duplicate client IDs."
-        else:
-            return f"Unexpected disconnect (error code: {rc})"
+        return _DISCONNECT_ERROR_MESSAGES.get(rc, f"Unexpected disconnect (error code: {rc})")
     
     def get_status(self) -> dict:
         """Get current MQTT service status"""
@@ -1410,6 +1669,11 @@ class MQTTService:
         # Reset previous clients list
         self.clients = []
         self._endpoints = []
+        if not self._device_lanes:
+            self._device_lanes = [
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"mqtt-upload-{i}")
+                for i in range(max(1, settings.MQTT_WORKERS))
+            ]
 
         if not self._config.enabled:
             logger.info("MQTT service is disabled in configuration")
@@ -1553,6 +1817,7 @@ class MQTTService:
                 client.on_connect = self.on_connect
                 client.on_disconnect = self.on_disconnect
                 client.on_message = self.on_message
+                client.on_socket_open = self.on_socket_open
             
                 # Configure broker-specific settings
                 if ep["type"] == "builtin":
@@ -1999,6 +2264,12 @@ class MQTTService:
             self.clients = []
             self.client = None
             self.is_connected = False
+            
+            # No more callbacks arrive once the clients are stopped; already queued uploads
+            # still finish in the background so received images aren't lost on reconnect
+            for lane in self._device_lanes:
+                lane.shutdown(wait=False)
+            self._device_lanes = []
             logger.info("MQTT client(s) stopped")
         except Exception as e:
             logger.error(f"Error stopping MQTT clients: {e}")
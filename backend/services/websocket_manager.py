@@ -1,101 +1,179 @@
 """WebSocket connection manager"""
-from typing import Dict, Set
+from typing import Awaitable, Callable, Dict, List, Optional, Set
 from fastapi import WebSocket
-import json
+import asyncio
+import logging
+from backend.utils.json_utils import json_dumps
+
+logger = logging.getLogger(__name__)
+
+# Clients sent to at once; larger rooms are sent in batches, yielding to other tasks in between
+BROADCAST_BATCH_SIZE = 50
 
 
 class WebSocketManager:
     """WebSocket connection manager"""
     
     def __init__(self):
-        # project_id -> Set[WebSocket]
-        self.active_connections: Dict[str, Set[WebSocket]] = {}
+        # project_id -> List[WebSocket] (connection order, removal by identity)
+        self.active_connections: Dict[str, List[WebSocket]] = {}
         # Global device connections (using special key "_devices")
         self.device_connections: Set[WebSocket] = set()
+        # project_id -> updates waiting for the next coalesced broadcast
+        self.pending_updates: Dict[str, List[dict]] = {}
+        # Event loop serving the WebSockets (captured on first connect), target of cross-thread broadcasts
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Strong references to fire-and-forget broadcast tasks (the loop only keeps weak ones)
+        self._tasks: Set[asyncio.Task] = set()
     
     async def connect(self, websocket: WebSocket, project_id: str):
         """Accept new connection"""
         await websocket.accept()
+        self._loop = asyncio.get_running_loop()
         
-        if project_id not in self.active_connections:
-            self.active_connections[project_id] = set()
-        
-        self.active_connections[project_id].add(websocket)
-        print(f"[WebSocket] Client connected to project {project_id}. Total: {len(self.active_connections[project_id])}")
+        self.active_connections.setdefault(project_id, []).append(websocket)
+        logger.info("[WebSocket] Client connected to project %s. Total: %d", project_id, len(self.active_connections[project_id]))
     
     def disconnect(self, websocket: WebSocket, project_id: str):
         """Disconnect"""
         if project_id in self.active_connections:
-            self.active_connections[project_id].discard(websocket)
+            connections = self.active_connections[project_id]
+            for index, connection in enumerate(connections):
+                if connection is websocket:
+                    del connections[index]
+                    break
             
-            if not self.active_connections[project_id]:
+            if not connections:
                 del self.active_connections[project_id]
             
-            print(f"[WebSocket] Client disconnected from project {project_id}")
+            logger.info("[WebSocket] Client disconnected from project %s", project_id)
     
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """Send personal message"""
         try:
             await websocket.send_json(message)
         except Exception as e:
-            print(f"[WebSocket] Error sending message: {e}")
+            logger.debug("[WebSocket] Error sending message: %s", e)
     
     async def broadcast_to_project(self, project_id: str, message: dict):
         """Broadcast to all clients in project"""
         if project_id not in self.active_connections:
-            print(f"[WebSocket] No active connections for project {project_id}")
+            logger.debug("[WebSocket] No active connections for project %s", project_id)
+            return
+        
+        await self._send_text_to_project(project_id, json_dumps(message))
+    
+    async def _send_text_to_project(self, project_id: str, payload: str):
+        """Send an already serialized payload to all clients in project"""
+        if project_id not in self.active_connections:
             return
         
         connection_count = len(self.active_connections[project_id])
-        print(f"[WebSocket] Broadcasting to {connection_count} client(s) in project {project_id}")
+        logger.debug("[WebSocket] Broadcasting to %d client(s) in project %s", connection_count, project_id)
         
-        disconnected = set()
+        disconnected_ids = set()
         success_count = 0
         
-        for connection in self.active_connections[project_id]:
-            try:
-                await connection.send_json(message)
+        # Send to all clients concurrently, so a slow client doesn't delay the others
+        # (snapshot: clients may connect/disconnect while sends are awaited)
+        connections = list(self.active_connections[project_id])
+        results = await self._send_all(connections, lambda connection: connection.send_text(payload))
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                logger.debug("[WebSocket] Error broadcasting to client: %s", result)
+                disconnected_ids.add(id(connection))
+            else:
                 success_count += 1
-            except Exception as e:
-                print(f"[WebSocket] Error broadcasting to client: {e}")
-                disconnected.add(connection)
         
-        # Clean up disconnected connections
-        for conn in disconnected:
-            self.disconnect(conn, project_id)
+        # Clean up disconnected connections in one pass over the current list
+        if disconnected_ids and project_id in self.active_connections:
+            survivors = [c for c in self.active_connections[project_id] if id(c) not in disconnected_ids]
+            if survivors:
+                self.active_connections[project_id] = survivors
+            else:
+                del self.active_connections[project_id]
+            logger.info("[WebSocket] Removed %d disconnected client(s) from project %s", len(disconnected_ids), project_id)
+        
+        logger.debug("[WebSocket] Successfully sent message to %d client(s)", success_count)
+    
+    async def _send_all(self, connections: List[WebSocket], send: Callable[[WebSocket], Awaitable]) -> List:
+        """Run send for every connection concurrently, return results/exceptions in connection order"""
+        if len(connections) <= BROADCAST_BATCH_SIZE:
+            return await asyncio.gather(*(send(connection) for connection in connections), return_exceptions=True)
+        
+        results = []
+        for start in range(0, len(connections), BROADCAST_BATCH_SIZE):
+            batch = connections[start:start + BROADCAST_BATCH_SIZE]
+            results.extend(await asyncio.gather(*(send(connection) for connection in batch), return_exceptions=True))
+            # Let HTTP handlers and other tasks run between batches
+            await asyncio.sleep(0)
+        return results
+    
+    def _queue_project_update(self, project_id: str, update: dict):
+        """Queue update for broadcast, updates queued in the same event loop tick share one frame"""
+        pending = self.pending_updates.get(project_id)
+        if pending is not None:
+            pending.append(update)
+            return
+        
+        self.pending_updates[project_id] = [update]
+        # The flush task runs after the current callback, so later updates in this tick join the batch
+        self._spawn(self._flush_project_updates(project_id))
+    
+    async def _flush_project_updates(self, project_id: str):
+        """Send all queued updates of a project as a single frame"""
+        updates = self.pending_updates.pop(project_id, [])
+        if not updates:
+            return
+        
+        if project_id not in self.active_connections:
+            logger.debug("[WebSocket] No active connections for project %s", project_id)
+            return
         
-        print(f"[WebSocket] Successfully sent message to {success_count} client(s)")
+        # A single update keeps the plain object format, bursts are sent as one JSON array
+        payload = json_dumps(updates[0] if len(updates) == 1 else updates)
+        await self._send_text_to_project(project_id, payload)
+    
+    def _call_in_loop(self, callback: Callable, *args) -> bool:
+        """Run callback on the WebSocket event loop, directly when already on it, otherwise thread-safely
+
+        Returns False when no loop is available (no client has connected yet).
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return False
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is loop:
+            callback(*args)
+        else:
+            # Called from a worker thread (e.g. MQTT): hand over without waiting
+            loop.call_soon_threadsafe(callback, *args)
+        return True
     
     def broadcast_project_update(self, project_id: str, update: dict):
-        """Broadcast project update (async call)"""
-        import asyncio
+        """Broadcast project update (fire-and-forget, callable from any thread)"""
         try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # If event loop is running, create task
-                asyncio.create_task(self.broadcast_to_project(project_id, update))
-                print(f"[WebSocket] Broadcasting update to project {project_id}: {update.get('type', 'unknown')}")
+            if self._call_in_loop(self._queue_project_update, project_id, update):
+                logger.debug("[WebSocket] Broadcasting update to project %s: %s", project_id, update.get('type', 'unknown'))
             else:
-                # If event loop is not running, run directly
-                loop.run_until_complete(self.broadcast_to_project(project_id, update))
-                print(f"[WebSocket] Broadcasting update to project {project_id}: {update.get('type', 'unknown')}")
-        except RuntimeError:
-            # If no event loop, create a new one
-            asyncio.run(self.broadcast_to_project(project_id, update))
-            print(f"[WebSocket] Broadcasting update to project {project_id}: {update.get('type', 'unknown')}")
+                logger.debug("[WebSocket] No active connections for project %s", project_id)
         except Exception as e:
-            print(f"[WebSocket] Error broadcasting update: {e}")
+            logger.error("[WebSocket] Error broadcasting update: %s", e)
     
     async def connect_device_listener(self, websocket: WebSocket):
         """Connect to global device update channel"""
         await websocket.accept()
+        self._loop = asyncio.get_running_loop()
         self.device_connections.add(websocket)
-        print(f"[WebSocket] Device listener connected. Total: {len(self.device_connections)}")
+        logger.info("[WebSocket] Device listener connected. Total: %d", len(self.device_connections))
     
     def disconnect_device_listener(self, websocket: WebSocket):
         """Disconnect from global device update channel"""
         self.device_connections.discard(websocket)
-        print(f"[WebSocket] Device listener disconnected. Total: {len(self.device_connections)}")
+        logger.info("[WebSocket] Device listener disconnected. Total: %d", len(self.device_connections))
     
     async def broadcast_device_update(self, message: dict):
         """Broadcast device update to all device list listeners"""
@@ -103,44 +181,46 @@ class WebSocketManager:
             return
         
         connection_count = len(self.device_connections)
-        print(f"[WebSocket] Broadcasting device update to {connection_count} listener(s)")
+        logger.debug("[WebSocket] Broadcasting device update to %d listener(s)", connection_count)
         
         disconnected = set()
         success_count = 0
         
-        for connection in self.device_connections:
-            try:
-                await connection.send_json(message)
-                success_count += 1
-            except Exception as e:
-                print(f"[WebSocket] Error broadcasting device update to client: {e}")
+        # Send to all listeners concurrently
+        # Serialize once for all listeners (send_json would encode per connection)
+        payload = json_dumps(message)
+        connections = list(self.device_connections)
+        results = await self._send_all(connections, lambda connection: connection.send_text(payload))
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                logger.debug("[WebSocket] Error broadcasting device update to client: %s", result)
                 disconnected.add(connection)
+            else:
+                success_count += 1
         
         # Clean up disconnected connections
         for conn in disconnected:
             self.disconnect_device_listener(conn)
         
-        print(f"[WebSocket] Successfully sent device update to {success_count} listener(s)")
+        logger.debug("[WebSocket] Successfully sent device update to %d listener(s)", success_count)
+    
+    def _start_device_broadcast(self, message: dict):
+        """Start broadcasting a device update (runs on the WebSocket event loop)"""
+        self._spawn(self.broadcast_device_update(message))
+    
+    def _spawn(self, coro):
+        """Run a coroutine as a background task, kept alive until it finishes"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
     
     def broadcast_device_update_sync(self, message: dict):
-        """Broadcast device update (async call)"""
-        import asyncio
+        """Broadcast device update (fire-and-forget, callable from any thread)"""
         try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # If event loop is running, create task
-                asyncio.create_task(self.broadcast_device_update(message))
-                print(f"[WebSocket] Broadcasting device update: {message.get('type', 'unknown')}")
-            else:
-                # If event loop is not running, run directly
-                loop.run_until_complete(self.broadcast_device_update(message))
-                print(f"[WebSocket] Broadcasting device update: {message.get('type', 'unknown')}")
-        except RuntimeError:
-            # If no event loop, create a new one
-            asyncio.run(self.broadcast_device_update(message))
-            print(f"[WebSocket] Broadcasting device update: {message.get('type', 'unknown')}")
+            if self._call_in_loop(self._start_device_broadcast, message):
+                logger.debug("[WebSocket] Broadcasting device update: %s", message.get('type', 'unknown'))
         except Exception as e:
-            print(f"[WebSocket] Error broadcasting device update: {e}")
+            logger.error("[WebSocket] Error broadcasting device update: %s", e)
 
 
 # Global WebSocket manager instance
@@ -1,25 +1,110 @@
 """
 Dataset import utilities for COCO and YOLO formats
 """
-import json
+import os
+import shutil
 import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional
 from PIL import Image
 import logging
+from backend.utils.image_size import fast_image_size
+from backend.utils.json_utils import json_loads
 
 logger = logging.getLogger(__name__)
 
+try:
+    import ijson
+    HAS_IJSON = True
+except ImportError:
+    HAS_IJSON = False
+    logger.warning("[Dataset Import] ijson not installed. Large COCO files will be loaded into memory at once: pip install ijson")
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+    logger.warning("[Dataset Import] numpy not installed. YOLO labels will be parsed line by line: pip install numpy")
+
+# COCO files above this size are stream-parsed (when ijson is available) instead of loaded whole
+COCO_STREAM_THRESHOLD_BYTES = 64 * 1024 * 1024
+
+# Threads reading image headers in parallel during YOLO import (I/O bound)
+IMAGE_PROBE_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Bytes read from each image to find its dimensions (covers JPEG EXIF/ICC segments before the frame header)
+IMAGE_HEADER_BYTES = 64 * 1024
+
+# Copy buffer and parallelism for ZIP extraction (zlib releases the GIL while inflating)
+ZIP_EXTRACT_BUFFER_SIZE = 1024 * 1024
+ZIP_EXTRACT_WORKERS = min(8, os.cpu_count() or 1)
+
+# Fields kept from streamed COCO objects (everything else, e.g. segmentation, is dropped while parsing)
+_COCO_IMAGE_FIELDS = ("id", "file_name", "width", "height")
+_COCO_CATEGORY_FIELDS = ("id", "name", "supercategory")
+_COCO_ANNOTATION_FIELDS = ("image_id", "category_id", "bbox")
+
+
+CATEGORY_COLORS = (
+    "#FF6B6B", "#4ECDC4", "#45B7D1", "#FFA07A", "#98D8C8",
+    "#F7DC6F", "#BB8FCE", "#85C1E2", "#F8B739", "#82E0AA",
+    "#F1948A", "#85C1E9", "#F7DC6F", "#BB8FCE", "#52BE80",
+    "#EC7063", "#5DADE2", "#F4D03F", "#AF7AC5", "#76D7C4"
+)
+
 
 def generate_color(index: int) -> str:
     """Generate a color for a class based on index"""
-    colors = [
-        "#FF6B6B", "#4ECDC4", "#45B7D1", "#FFA07A", "#98D8C8",
-        "#F7DC6F", "#BB8FCE", "#85C1E2", "#F8B739", "#82E0AA",
-        "#F1948A", "#85C1E9", "#F7DC6F", "#BB8FCE", "#52BE80",
-        "#EC7063", "#5DADE2", "#F4D03F", "#AF7AC5", "#76D7C4"
-    ]
-    return colors[index % len(colors)]
+    return CATEGORY_COLORS[index % len(CATEGORY_COLORS)]
+
+
+def _member_target(target_dir: Path, filename: str) -> Path:
+    """Destination of a ZIP member, sanitized like ZipFile.extract (no absolute paths, drive letters or '..')"""
+    arcname = filename.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    invalid_path_parts = ('', os.path.curdir, os.path.pardir)
+    parts = [part for part in arcname.split(os.path.sep) if part not in invalid_path_parts]
+    return target_dir.joinpath(*parts)
+
+
+def extract_zip(zip_path: Path, target_dir: Path):
+    """
+    Extract an uploaded ZIP archive into target_dir
+    
+    Same result as ZipFile.extractall, but members are inflated in parallel,
+    copied with a 1 MiB buffer and their CRC-32 isn't verified (uploads are
+    extracted to a private temp directory and parsed right after).
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        # target -> member (a name repeated in the archive is written once, the last entry wins like extractall)
+        files = {}
+        for info in zip_ref.infolist():
+            target = _member_target(target_dir, info.filename)
+            if target == target_dir:
+                continue
+            if info.is_dir():
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if not info.flag_bits & 0x1:
+                # ZipExtFile skips the CRC check without a reference value (encrypted members need it)
+                info.CRC = None
+            files[target] = info
+        
+        def extract_member(item):
+            target, info = item
+            with zip_ref.open(info) as src, open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst, ZIP_EXTRACT_BUFFER_SIZE)
+        
+        # ZipFile serializes reads of the shared file handle; decompression runs in parallel
+        with ThreadPoolExecutor(max_workers=ZIP_EXTRACT_WORKERS) as pool:
+            for _ in pool.map(extract_member, files.items()):
+                pass
 
 
 class DatasetImporter:
@@ -68,9 +153,9 @@ class COCOImporter:
             Dict with import statistics
         """
         try:
-            # Read COCO JSON file
+            # Locate COCO JSON file
             if dataset_path.is_file():
-                coco_data = json.loads(dataset_path.read_text())
+                annotations_file = dataset_path
                 images_dir = dataset_path.parent
             else:
                 # If it's a directory, look for annotations file
@@ -79,27 +164,32 @@ class COCOImporter:
                     annotations_file = dataset_path / "instances_default.json"
                 if not annotations_file.exists():
                     raise FileNotFoundError("COCO annotations file not found (expected annotations.json or instances_default.json)")
-                coco_data = json.loads(annotations_file.read_text())
                 images_dir = dataset_path / "images"
                 if not images_dir.exists():
                     images_dir = dataset_path
             
-            images = coco_data.get("images", [])
-            annotations = coco_data.get("annotations", [])
-            categories = coco_data.get("categories", [])
+            if HAS_IJSON and annotations_file.stat().st_size > COCO_STREAM_THRESHOLD_BYTES:
+                # Huge file: stream the arrays, annotations are grouped as they are parsed
+                categories = list(COCOImporter._stream_items(annotations_file, "categories.item", _COCO_CATEGORY_FIELDS))
+                images = list(COCOImporter._stream_items(annotations_file, "images.item", _COCO_IMAGE_FIELDS))
+                annotations = COCOImporter._stream_items(annotations_file, "annotations.item", _COCO_ANNOTATION_FIELDS)
+            else:
+                coco_data = json_loads(annotations_file.read_bytes())
+                images = coco_data.get("images", [])
+                annotations = coco_data.get("annotations", [])
+                categories = coco_data.get("categories", [])
+                del coco_data
             
             # Build mappings
             image_id_to_info = {img["id"]: img for img in images}
             category_id_to_info = {cat["id"]: cat for cat in categories}
+            category_id_to_name = {cid: cat["name"] for cid, cat in category_id_to_info.items()}
             image_filename_to_id = {img["file_name"]: img["id"] for img in images}
             
             # Group annotations by image_id
-            annotations_by_image = {}
+            annotations_by_image = defaultdict(list)
             for ann in annotations:
-                image_id = ann["image_id"]
-                if image_id not in annotations_by_image:
-                    annotations_by_image[image_id] = []
-                annotations_by_image[image_id].append(ann)
+                annotations_by_image[ann["image_id"]].append(ann)
             
             # Prepare result
             result = {
@@ -128,11 +218,13 @@ class COCOImporter:
                 }
                 
                 # Get annotations for this image
-                if img["id"] in annotations_by_image:
-                    for ann in annotations_by_image[img["id"]]:
+                image_annotations = annotations_by_image.get(img["id"])
+                if image_annotations:
+                    append_annotation = img_info["annotations"].append
+                    for ann in image_annotations:
                         category_id = ann["category_id"]
-                        category = category_id_to_info.get(category_id)
-                        if not category:
+                        category_name = category_id_to_name.get(category_id)
+                        if category_name is None:
                             continue
                         
                         # Convert COCO bbox [x, y, width, height] to our format [x_min, y_min, x_max, y_max]
@@ -145,9 +237,9 @@ class COCOImporter:
                                 "x_max": float(x + w),
                                 "y_max": float(y + h)
                             }
-                            img_info["annotations"].append({
+                            append_annotation({
                                 "category_id": category_id,
-                                "category_name": category["name"],
+                                "category_name": category_name,
                                 "data": annotation_data,
                                 "type": "bbox"
                             })
@@ -159,6 +251,13 @@ class COCOImporter:
         except Exception as e:
             logger.error(f"[Dataset Import] Failed to parse COCO format: {e}", exc_info=True)
             raise ValueError(f"Failed to parse COCO format: {str(e)}")
+    
+    @staticmethod
+    def _stream_items(annotations_file: Path, prefix: str, fields: Tuple[str, ...]) -> Iterator[Dict]:
+        """Stream the objects of one top-level COCO array, keeping only the given fields"""
+        with open(annotations_file, 'rb') as f:
+            for item in ijson.items(f, prefix, use_float=True):
+                yield {key: item[key] for key in fields if key in item}
 
 
 class YOLOImporter:
@@ -237,15 +336,15 @@ class YOLOImporter:
                     "name": class_name
                 })
             
+            # Get image dimensions (file opens overlap across threads)
+            with ThreadPoolExecutor(max_workers=IMAGE_PROBE_WORKERS) as pool:
+                image_sizes = list(pool.map(YOLOImporter._probe_image_size, image_files))
+            
             # Process images
-            for img_file in image_files:
-                # Get image dimensions
-                try:
-                    img = Image.open(img_file)
-                    width, height = img.size
-                except Exception as e:
-                    logger.warning(f"[Dataset Import] Failed to read image {img_file}: {e}")
+            for img_file, size in zip(image_files, image_sizes):
+                if size is None:
                     continue
+                width, height = size
                 
                 img_info = {
                     "file_name": img_file.name,
@@ -258,48 +357,28 @@ class YOLOImporter:
                 if labels_dir and labels_dir.exists():
                     label_file = labels_dir / f"{img_file.stem}.txt"
                     if label_file.exists():
-                        label_lines = label_file.read_text().splitlines()
-                        for line in label_lines:
-                            parts = line.strip().split()
-                            if len(parts) >= 5:
-                                try:
-                                    class_id = int(parts[0])
-                                    center_x = float(parts[1])
-                                    center_y = float(parts[2])
-                                    w = float(parts[3])
-                                    h = float(parts[4])
-                                    
-                                    # Convert YOLO format (normalized center, width, height) to our format (x_min, y_min, x_max, y_max)
-                                    x_min = (center_x - w / 2) * width
-                                    y_min = (center_y - h / 2) * height
-                                    x_max = (center_x + w / 2) * width
-                                    y_max = (center_y + h / 2) * height
-                                    
-                                    # Ensure class exists
-                                    if class_id >= len(classes):
-                                        # Auto-create class name if not in classes.txt
-                                        while len(classes) <= class_id:
-                                            classes.append(f"class_{len(classes)}")
-                                        result["categories"] = [
-                                            {"id": idx, "name": name}
-                                            for idx, name in enumerate(classes)
-                                        ]
-                                    
-                                    class_name = classes[class_id] if class_id < len(classes) else f"class_{class_id}"
-                                    annotation_data = {
-                                        "x_min": float(x_min),
-                                        "y_min": float(y_min),
-                                        "x_max": float(x_max),
-                                        "y_max": float(y_max)
-                                    }
-                                    img_info["annotations"].append({
-                                        "category_id": class_id,
-                                        "category_name": class_name,
-                                        "data": annotation_data,
-                                        "type": "bbox"
-                                    })
-                                except (ValueError, IndexError) as e:
-                                    logger.warning(f"[Dataset Import] Failed to parse label line in {label_file}: {line} - {e}")
+                        for class_id, x_min, y_min, x_max, y_max in YOLOImporter._read_label_boxes(label_file, width, height):
+                            # Ensure class exists
+                            # Auto-create class name if not in classes.txt (only the new entries are appended)
+                            while len(classes) <= class_id:
+                                new_idx = len(classes)
+                                new_name = f"class_{new_idx}"
+                                classes.append(new_name)
+                                result["categories"].append({"id": new_idx, "name": new_name})
+                            
+                            class_name = classes[class_id] if class_id < len(classes) else f"class_{class_id}"
+                            annotation_data = {
+                                "x_min": x_min,
+                                "y_min": y_min,
+                                "x_max": x_max,
+                                "y_max": y_max
+                            }
+                            img_info["annotations"].append({
+                                "category_id": class_id,
+                                "category_name": class_name,
+                                "data": annotation_data,
+                                "type": "bbox"
+                            })
                 
                 result["images"].append(img_info)
             
@@ -309,17 +388,83 @@ class YOLOImporter:
             logger.error(f"[Dataset Import] Failed to parse YOLO format: {e}", exc_info=True)
             raise ValueError(f"Failed to parse YOLO format: {str(e)}")
     
+    @staticmethod
+    def _probe_image_size(img_file: Path) -> Optional[Tuple[int, int]]:
+        """Get (width, height) of an image, None if it can't be read"""
+        try:
+            # Read the size from the header bytes, open with PIL only for formats/layouts not handled there
+            with open(img_file, 'rb') as f:
+                size = fast_image_size(f.read(IMAGE_HEADER_BYTES))
+            if size is not None:
+                return size
+            with Image.open(img_file) as img:
+                return img.size
+        except Exception as e:
+            logger.warning(f"[Dataset Import] Failed to read image {img_file}: {e}")
+            return None
+    
+    @staticmethod
+    def _read_label_boxes(label_file: Path, width: int, height: int) -> List[Tuple[int, float, float, float, float]]:
+        """
+        Read a YOLO label file as (class_id, x_min, y_min, x_max, y_max) boxes in pixels
+        
+        Well-formed files are parsed and converted in one go with numpy; files numpy can't
+        take (ragged rows such as polygons, malformed lines) go through the line parser,
+        which skips and logs bad lines.
+        """
+        text = label_file.read_text()
+        if HAS_NUMPY and text.strip():
+            try:
+                arr = np.loadtxt(text.splitlines(), dtype=np.float64, comments=None, ndmin=2)
+                if arr.shape[1] >= 5 and np.array_equal(arr[:, 0], np.floor(arr[:, 0])):
+                    center_x, center_y, w, h = arr[:, 1], arr[:, 2], arr[:, 3], arr[:, 4]
+                    # Convert YOLO format (normalized center, width, height) to our format (x_min, y_min, x_max, y_max)
+                    return list(zip(
+                        arr[:, 0].astype(np.int64).tolist(),
+                        ((center_x - w / 2) * width).tolist(),
+                        ((center_y - h / 2) * height).tolist(),
+                        ((center_x + w / 2) * width).tolist(),
+                        ((center_y + h / 2) * height).tolist()
+                    ))
+            except ValueError:
+                pass
+        
+        boxes = []
+        for line in text.splitlines():
+            parts = line.strip().split()
+            if len(parts) >= 5:
+                try:
+                    class_id = int(parts[0])
+                    center_x = float(parts[1])
+                    center_y = float(parts[2])
+                    w = float(parts[3])
+                    h = float(parts[4])
+                    boxes.append((
+                        class_id,
+                        (center_x - w / 2) * width,
+                        (center_y - h / 2) * height,
+                        (center_x + w / 2) * width,
+                        (center_y + h / 2) * height
+                    ))
+                except (ValueError, IndexError) as e:
+                    logger.warning(f"[Dataset Import] Failed to parse label line in {label_file}: {line} - {e}")
+        return boxes
+    
     @staticmethod
     def _import_from_zip(project_id: str, zip_path: Path) -> Dict:
-        """Extract and import YOLO dataset from ZIP file"""
+        """
+        Extract and import YOLO dataset from ZIP file
+        
+        The extracted tree is kept, since images_dir/labels_dir point into it:
+        its path is returned as "extracted_dir" and the caller removes it once
+        the images are copied (e.g. in a background task after the response).
+        """
         import tempfile
-        import shutil
         
         temp_dir = Path(tempfile.mkdtemp())
         try:
             # Extract ZIP
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
+            extract_zip(zip_path, temp_dir)
             
             # Find dataset root (might be in a subdirectory)
             dataset_root = temp_dir
@@ -329,7 +474,11 @@ class YOLOImporter:
                     dataset_root = subdir
             
             # Import from extracted directory
-            return YOLOImporter.import_dataset(project_id, dataset_root)
-        finally:
+            result = YOLOImporter.import_dataset(project_id, dataset_root)
+        except Exception:
             # Cleanup
             shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+        
+        result["extracted_dir"] = str(temp_dir)
+        return result
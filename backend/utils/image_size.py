@@ -0,0 +1,85 @@
+"""Read image dimensions from JPEG/PNG/GIF/WEBP/BMP headers without decoding"""
+import struct
+from typing import Optional, Tuple
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Start-of-frame markers carrying the frame size (excludes DHT 0xC4, JPG 0xC8, DAC 0xCC)
+_JPEG_SOF_MARKERS = frozenset({0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF})
+
+# Markers without a length field
+_JPEG_STANDALONE_MARKERS = frozenset({0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8})
+
+
+def fast_image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Get (width, height) of a PNG, JPEG, GIF, WEBP or BMP image from its header
+
+    Args:
+        data: Encoded image bytes (a prefix is enough, e.g. the first 64 KiB of the file)
+
+    Returns:
+        (width, height), or None for other formats or malformed headers (callers fall back to PIL)
+    """
+    if data[:8] == _PNG_SIGNATURE:
+        # IHDR is always the first chunk: width and height at bytes 16-24
+        if len(data) < 24 or data[12:16] != b"IHDR":
+            return None
+        return struct.unpack(">II", data[16:24])
+
+    if data[:2] == b"\xff\xd8":
+        pos = 2
+        size = len(data)
+        while pos + 1 < size:
+            if data[pos] != 0xFF:
+                return None
+            marker = data[pos + 1]
+            pos += 2
+            if marker == 0xFF:
+                # Fill byte, the marker follows
+                pos -= 1
+                continue
+            if marker in _JPEG_STANDALONE_MARKERS:
+                continue
+            if marker == 0xD9 or pos + 2 > size:
+                return None
+            (segment_length,) = struct.unpack(">H", data[pos:pos + 2])
+            if marker in _JPEG_SOF_MARKERS:
+                # Segment: length(2) precision(1) height(2) width(2)
+                if pos + 7 > size:
+                    return None
+                height, width = struct.unpack(">HH", data[pos + 3:pos + 7])
+                return width, height
+            pos += segment_length
+        return None
+
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        if len(data) < 10:
+            return None
+        return struct.unpack("<HH", data[6:10])
+
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        chunk = data[12:16]
+        if chunk == b"VP8 " and len(data) >= 30:
+            # Lossy: 14 bit sizes after the key frame start code
+            width, height = struct.unpack("<HH", data[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L" and len(data) >= 25:
+            # Lossless: 14 bit (size - 1) fields packed after the signature byte
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X" and len(data) >= 30:
+            # Extended: 24 bit (size - 1) fields
+            return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+        return None
+
+    if data[:2] == b"BM" and len(data) >= 26:
+        (header_size,) = struct.unpack("<I", data[14:18])
+        if header_size == 12:
+            # OS/2 BITMAPCOREHEADER: 16 bit sizes
+            return struct.unpack("<HH", data[18:22])
+        # Negative height means a top-down bitmap
+        width, height = struct.unpack("<ii", data[18:26])
+        return width, abs(height)
+
+    return None
@@ -0,0 +1,44 @@
+"""JSON serialization helpers (orjson when available, stdlib json otherwise)"""
+import json
+import logging
+from typing import Any, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+    logger.warning("[JSON] orjson not installed. Falling back to the slower stdlib json module: pip install orjson")
+
+
+def json_loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    """Parse JSON from str or bytes"""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps_bytes(obj: Any, indent: bool = False, sort_keys: bool = False) -> bytes:
+    """
+    Serialize obj to UTF-8 encoded JSON bytes
+
+    Args:
+        obj: Object to serialize (non-str dict keys are allowed)
+        indent: Pretty-print with 2 space indentation
+        sort_keys: Sort dict keys (stable output for hashing)
+    """
+    if HAS_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None, sort_keys=sort_keys).encode("utf-8")
+
+
+def json_dumps(obj: Any, indent: bool = False, sort_keys: bool = False) -> str:
+    """Serialize obj to a JSON string (see json_dumps_bytes)"""
+    return json_dumps_bytes(obj, indent=indent, sort_keys=sort_keys).decode("utf-8")
@@ -9,9 +9,65 @@ from pathlib import Path
 from typing import Optional
 from backend.config import settings
 
+try:
+    # libgit2 bindings: clone in-process instead of spawning git
+    import pygit2
+    HAS_PYGIT2 = True
+except ImportError:
+    HAS_PYGIT2 = False
+
 NE301_REPO_URL = "https://github.com/camthink-ai/ne301.git"
 DEFAULT_NE301_PATH = Path("/app/ne301")
 
+# Written into .git/ (not the worktree, where git status would report it as a local change)
+# once the project structure is validated; later startups skip the checks while it's newer than HEAD
+READY_SENTINEL = Path(".git") / "aitoolstack_ne301_ready"
+
+# Files rewritten when the checkout moves (branch switch, pull, reset)
+_GIT_HEAD_FILES = ("HEAD", "ORIG_HEAD")
+
+
+def _is_marked_ready(project_path: Path) -> bool:
+    """Whether project_path was validated before and its checkout hasn't moved since"""
+    try:
+        ready_mtime = os.stat(project_path / READY_SENTINEL).st_mtime
+    except OSError:
+        return False
+    for name in _GIT_HEAD_FILES:
+        try:
+            if os.stat(project_path / ".git" / name).st_mtime > ready_mtime:
+                return False
+        except OSError:
+            continue
+    return True
+
+
+def _mark_ready(project_path: Path):
+    """Record a successful validation (only for git checkouts)"""
+    try:
+        if (project_path / ".git").is_dir():
+            (project_path / READY_SENTINEL).touch()
+    except OSError:
+        pass
+
+
+def _clone_ne301(target: Path):
+    """
+    Shallow-clone the NE301 repository into target (pygit2 when installed, git CLI otherwise)
+    
+    Only the latest commit of the default branch is fetched; `git pull` still
+    works for updates, `git fetch --unshallow` restores the full history.
+    """
+    if HAS_PYGIT2:
+        pygit2.clone_repository(NE301_REPO_URL, str(target), depth=1)
+        return
+    subprocess.run(
+        ["git", "clone", "--depth", "1", "--single-branch", NE301_REPO_URL, str(target)],
+        check=True,
+        capture_output=True,
+        text=True
+    )
+
 
 def ensure_ne301_project(ne301_path: Optional[Path] = None) -> Path:
     """
@@ -40,18 +96,20 @@ def ensure_ne301_project(ne301_path: Optional[Path] = None) -> Path:
     # Check mounted host directory (/workspace/ne301)
     # In Docker Compose, host directory is mounted to /workspace/ne301
     workspace_path = Path("/workspace/ne301")
-    if workspace_path.exists() and workspace_path.is_dir():
+    workspace_is_dir = workspace_path.is_dir()
+    
+    # Fast path: already validated and unchanged since
+    ready_path = workspace_path if workspace_is_dir else ne301_path
+    if _is_marked_ready(ready_path):
+        return ready_path
+    
+    if workspace_is_dir:
         # Check if empty directory or symlink
         try:
             if not any(workspace_path.iterdir()):
                 # Empty directory, clone project
                 print(f"[NE301] Workspace directory is empty, cloning to {workspace_path}")
-                subprocess.run(
-                    ["git", "clone", NE301_REPO_URL, str(workspace_path)],
-                    check=True,
-                    capture_output=True,
-                    text=True
-                )
+                _clone_ne301(workspace_path)
                 print(f"[NE301] Successfully cloned to workspace: {workspace_path}")
             # Use workspace directory
             ne301_path = workspace_path
@@ -63,48 +121,35 @@ def ensure_ne301_project(ne301_path: Optional[Path] = None) -> Path:
         print(f"[NE301] Project directory not found: {ne301_path}")
         print(f"[NE301] Cloning NE301 project from {NE301_REPO_URL}...")
         
-        try:
-            # Check if git is available
-            subprocess.run(
-                ["git", "--version"],
-                check=True,
-                capture_output=True
-            )
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            print("[NE301] ERROR: git is not available. Cannot clone NE301 project.")
-            print("[NE301] Please install git in Dockerfile or mount the project manually.")
-            return ne301_path
-        
         # Create parent directory
         ne301_path.parent.mkdir(parents=True, exist_ok=True)
         
         # Clone project
         try:
-            subprocess.run(
-                ["git", "clone", NE301_REPO_URL, str(ne301_path)],
-                check=True,
-                capture_output=True,
-                text=True
-            )
+            _clone_ne301(ne301_path)
             print(f"[NE301] Successfully cloned NE301 project to {ne301_path}")
+        except FileNotFoundError:
+            # git executable missing (and pygit2 not installed)
+            print("[NE301] ERROR: git is not available. Cannot clone NE301 project.")
+            print("[NE301] Please install git in Dockerfile or mount the project manually.")
+            return ne301_path
         except subprocess.CalledProcessError as e:
             print(f"[NE301] ERROR: Failed to clone NE301 project: {e}")
             print(f"[NE301] stdout: {e.stdout}")
             print(f"[NE301] stderr: {e.stderr}")
             print(f"[NE301] You can manually clone the project or set NE301_PROJECT_PATH to an existing path.")
             return ne301_path
+        except Exception as e:
+            print(f"[NE301] ERROR: Failed to clone NE301 project: {e}")
+            print(f"[NE301] You can manually clone the project or set NE301_PROJECT_PATH to an existing path.")
+            return ne301_path
     
     # If directory exists but is empty, try to clone
     if ne301_path.exists() and ne301_path.is_dir():
         try:
             if not any(ne301_path.iterdir()):
                 print(f"[NE301] Directory exists but is empty, cloning...")
-                subprocess.run(
-                    ["git", "clone", NE301_REPO_URL, str(ne301_path)],
-                    check=True,
-                    capture_output=True,
-                    text=True
-                )
+                _clone_ne301(ne301_path)
                 print(f"[NE301] Successfully cloned to {ne301_path}")
         except Exception as e:
             print(f"[NE301] Warning: Directory check failed: {e}")
@@ -122,6 +167,7 @@ def ensure_ne301_project(ne301_path: Optional[Path] = None) -> Path:
         return ne301_path
     
     print(f"[NE301] Project ready at: {ne301_path}")
+    _mark_ready(ne301_path)
     return ne301_path
 
 
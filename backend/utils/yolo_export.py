@@ -1,140 +1,411 @@
 """YOLO format export tool"""
-import json
+import errno
+import io
+import logging
+import os
+import re
 import shutil
-import yaml
+import sys
+import tarfile
+import time
 import random
-from typing import List, Dict, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Optional, Tuple, Union
 from pathlib import Path
+from backend.utils.json_utils import json_dumps, json_loads
 
+logger = logging.getLogger(__name__)
 
-class YOLOExporter:
-    """YOLO format exporter"""
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+    logger.warning("[YOLO Export] numpy not installed. Annotations will be normalized one by one: pip install numpy")
+
+# Boxes per image / points per polygon from which normalization is vectorized (numpy call overhead dominates below)
+VECTORIZE_MIN_COUNT = 8
+
+# Label line formats, filled in one %-operation (fixed 6 decimals like the normalized values)
+BBOX_LINE_FORMAT = "%d %.6f %.6f %.6f %.6f"
+POINT_FORMAT = " %.6f"
+
+# Label archive written per split when export_project(labels_archive=True)
+LABELS_ARCHIVE_NAME = "labels.tar"
+
+# Strings written as plain YAML scalars in data.yaml, anything else is double-quoted
+_YAML_PLAIN_RE = re.compile(r"[A-Za-z_/][A-Za-z0-9_ ./-]*")
+# Plain words YAML resolves to booleans/null instead of strings
+_YAML_RESERVED_WORDS = frozenset({"y", "n", "yes", "no", "true", "false", "on", "off", "null"})
+
+# Image copies / label writes in flight during export (I/O bound, the GIL is released while copying)
+EXPORT_IO_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# User space copy buffer (the 16-64 KiB default means many more read/write pairs on slow or network disks)
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# copy_file_range errors meaning "not supported for these files" (fall back to a regular copy)
+_COPY_FALLBACK_ERRNOS = frozenset({errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF})
+
+
+def _copy_buffered(src: str, dst: str):
+    """Copy file contents in user space through one reused COPY_BUFFER_SIZE buffer (no per-chunk allocation)"""
+    with open(src, 'rb', buffering=0) as fsrc, open(dst, 'wb', buffering=0) as fdst:
+        with memoryview(bytearray(COPY_BUFFER_SIZE)) as buffer:
+            while True:
+                n = fsrc.readinto(buffer)
+                if not n:
+                    break
+                written = 0
+                while written < n:
+                    written += fdst.write(buffer[written:n])
+
+
+def _fast_copy(src: str, dst: str):
+    """
+    Copy file contents without metadata (YOLO training doesn't use mtimes/permissions)
+
+    On Linux the data is copied inside the kernel with copy_file_range, which is a
+    reflink on filesystems that support it (Btrfs/XFS). Otherwise shutil.copyfile
+    uses the kernel fast path (sendfile/fcopyfile) where there is one, and the rest
+    (e.g. Windows, network shares) copies through a 1 MiB buffer.
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+                chunk = max(os.fstat(in_fd).st_size, 8 * 1024 * 1024)
+                while os.copy_file_range(in_fd, out_fd, chunk):
+                    pass
+            return
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+    if hasattr(os, "sendfile") or sys.platform == "darwin":
+        shutil.copyfile(src, dst)
+    else:
+        _copy_buffered(src, dst)
+
+
+def _link_or_copy(src: str, dst: str):
+    """Hard link dst to src (no data copied), copy when linking isn't possible (other filesystem, no support)"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        _fast_copy(src, dst)
+
+
+def _list_dir(path: str) -> set:
+    """Names of the entries in a directory (empty when it doesn't exist)"""
+    try:
+        with os.scandir(path) as it:
+            return {entry.name for entry in it}
+    except (FileNotFoundError, NotADirectoryError):
+        return set()
+
+
+def _yaml_scalar(value: str) -> str:
+    """YAML representation of a string: plain when unambiguous, else double-quoted (JSON strings are valid YAML)"""
+    if (_YAML_PLAIN_RE.fullmatch(value) and not value.endswith(" ")
+            and value.lower() not in _YAML_RESERVED_WORDS):
+        return value
+    return json_dumps(value)
+
+
+def _label_payload(label_lines: List[str]) -> bytes:
+    """Encoded content of a label file"""
+    return '\n'.join(label_lines).encode('utf-8')
+
+
+def _write_label_file(label_file: str, payload: bytes):
+    """Write the label file of one image (one raw write, bypassing the text I/O layer)"""
+    view = memoryview(payload)
+    fd = os.open(label_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def _add_to_archive(archive: tarfile.TarFile, name: str, payload: bytes, mtime: float):
+    """Append an in-memory file to a tar archive"""
+    info = tarfile.TarInfo(name)
+    info.size = len(payload)
+    info.mtime = mtime
+    archive.addfile(info, io.BytesIO(payload))
+
+
+def _normalize_bbox(x_min: float, y_min: float, x_max: float, y_max: float,
+                    img_width: int, img_height: int) -> Tuple[float, float, float, float]:
+    """
+    Convert bounding box coordinates to YOLO format (normalized center point coordinates and width/height)
     
-    @staticmethod
-    def normalize_bbox(x_min: float, y_min: float, x_max: float, y_max: float,
-                      img_width: int, img_height: int) -> Tuple[float, float, float, float]:
-        """
-        Convert bounding box coordinates to YOLO format (normalized center point coordinates and width/height)
+    Args:
+        x_min, y_min, x_max, y_max: Bounding box absolute coordinates
+        img_width, img_height: Image dimensions
         
-        Args:
-            x_min, y_min, x_max, y_max: Bounding box absolute coordinates
-            img_width, img_height: Image dimensions
-            
-        Returns:
-            (center_x, center_y, width, height) normalized coordinates (0~1)
-        """
-        # Calculate absolute width and height
-        box_w = x_max - x_min
-        box_h = y_max - y_min
+    Returns:
+        (center_x, center_y, width, height) normalized coordinates (0~1)
+    """
+    # Calculate absolute width and height
+    box_w = x_max - x_min
+    box_h = y_max - y_min
+    
+    # Calculate absolute center point
+    center_x = x_min + (box_w / 2)
+    center_y = y_min + (box_h / 2)
+    
+    # Normalize (keep 6 decimal places)
+    yolo_x = round(center_x / img_width, 6)
+    yolo_y = round(center_y / img_height, 6)
+    yolo_w = round(box_w / img_width, 6)
+    yolo_h = round(box_h / img_height, 6)
+    
+    return yolo_x, yolo_y, yolo_w, yolo_h
+
+
+def _normalize_bboxes(boxes: "np.ndarray", img_width: int, img_height: int) -> "np.ndarray":
+    """
+    Vectorized _normalize_bbox for all boxes of an image (requires numpy)
+    
+    Args:
+        boxes: (N, 4) array of [x_min, y_min, x_max, y_max] absolute coordinates
+        img_width, img_height: Image dimensions
         
-        # Calculate absolute center point
-        center_x = x_min + (box_w / 2)
-        center_y = y_min + (box_h / 2)
+    Returns:
+        (N, 4) array of [center_x, center_y, width, height] normalized coordinates (0~1),
+        not rounded (label lines are formatted with 6 decimals)
+    """
+    scale = np.array([1.0 / img_width, 1.0 / img_height], dtype=np.float64)
+    top_left = boxes[:, :2]
+    bottom_right = boxes[:, 2:]
+    return np.hstack([(top_left + bottom_right) * (0.5 * scale), (bottom_right - top_left) * scale])
+
+
+def _normalize_points_flat(coords: Union[List[float], "np.ndarray"], img_width: int, img_height: int,
+                           decimals: Optional[int] = 6) -> "np.ndarray":
+    """
+    Normalize flat polygon/keypoint coordinates in one broadcast (requires numpy)
+    
+    Args:
+        coords: [x1, y1, x2, y2, ...] list or array
+        img_width, img_height: Image dimensions
+        decimals: Decimal places to round to, None to skip rounding
         
-        # Normalize (keep 6 decimal places)
-        yolo_x = round(center_x / img_width, 6)
-        yolo_y = round(center_y / img_height, 6)
-        yolo_w = round(box_w / img_width, 6)
-        yolo_h = round(box_h / img_height, 6)
+    Returns:
+        One-dimensional array [x1, y1, x2, y2, ...] normalized coordinates
+    """
+    normalized = np.asarray(coords, dtype=np.float64).reshape(-1, 2) * (1.0 / img_width, 1.0 / img_height)
+    if decimals is not None:
+        normalized = np.round(normalized, decimals)
+    return normalized.ravel()
+
+
+def _normalize_points(points: Union[List[List[float]], List[float], "np.ndarray"], img_width: int, img_height: int,
+                      decimals: Optional[int] = 6) -> List[float]:
+    """
+    Normalize polygon/keypoint coordinates
+    
+    Args:
+        points: [[x, y], ...], [[x, y, index], ...], [{'x': x, 'y': y}, ...],
+            or the flat layout [x1, y1, x2, y2, ...] (list or array)
+        img_width, img_height: Image dimensions
+        decimals: Decimal places to round to, None to skip rounding (when the output format rounds anyway)
         
-        return yolo_x, yolo_y, yolo_w, yolo_h
+    Returns:
+        One-dimensional array [x1, y1, x2, y2, ...] normalized coordinates
+    """
+    if len(points) == 0:
+        return []
+    inv_w = 1.0 / img_width
+    inv_h = 1.0 / img_height
     
-    @staticmethod
-    def normalize_points(points: List[List[float]], img_width: int, img_height: int) -> List[float]:
-        """
-        Normalize polygon/keypoint coordinates
+    # Flat layout: no per-point structure to unpack
+    if isinstance(points[0], (int, float)) or (HAS_NUMPY and isinstance(points, np.ndarray) and points.ndim == 1):
+        if HAS_NUMPY:
+            return _normalize_points_flat(points, img_width, img_height, decimals).tolist()
+        normalized = []
+        append = normalized.append
+        for x, y in zip(points[0::2], points[1::2]):
+            append(x * inv_w)
+            append(y * inv_h)
+    else:
+        if HAS_NUMPY and (len(points) >= VECTORIZE_MIN_COUNT or isinstance(points, np.ndarray)):
+            try:
+                arr = np.asarray(points, dtype=np.float64)
+            except (TypeError, ValueError, KeyError):
+                # {'x', 'y'} points or ragged lists: normalized one by one below
+                arr = None
+            if arr is not None and arr.ndim == 2 and arr.shape[1] >= 2:
+                normalized = arr[:, :2] * (inv_w, inv_h)
+                if decimals is not None:
+                    normalized = np.round(normalized, decimals)
+                return normalized.ravel().tolist()
         
-        Args:
-            points: [[x, y], ...] or [[x, y, index], ...]
-            img_width, img_height: Image dimensions
-            
-        Returns:
-            One-dimensional array [x1, y1, x2, y2, ...] normalized coordinates
-        """
         normalized = []
+        append = normalized.append
         for point in points:
             x = point[0] if isinstance(point, list) else point['x']
             y = point[1] if isinstance(point, list) else point['y']
-            normalized.append(round(x / img_width, 6))
-            normalized.append(round(y / img_height, 6))
-        return normalized
+            append(x * inv_w)
+            append(y * inv_h)
+    if decimals is not None:
+        normalized = [round(value, decimals) for value in normalized]
+    return normalized
+
+
+def _export_bbox(data: Dict, class_id: int, img_width: int, img_height: int) -> str:
+    """YOLO line of a bbox annotation ("class_id x y w h")"""
+    yolo_x, yolo_y, yolo_w, yolo_h = _normalize_bbox(
+        data['x_min'], data['y_min'], data['x_max'], data['y_max'], img_width, img_height
+    )
+    return BBOX_LINE_FORMAT % (class_id, yolo_x, yolo_y, yolo_w, yolo_h)
+
+
+def _export_points(data: Dict, class_id: int, img_width: int, img_height: int) -> str:
+    """YOLO line of a polygon/keypoint annotation ("class_id x1 y1 x2 y2 ...")"""
+    normalized_points = _normalize_points(data.get('points', []), img_width, img_height, decimals=None)
+    return ("%d" + POINT_FORMAT * len(normalized_points)) % (class_id, *normalized_points)
+
+
+# Annotation type -> line exporter
+_ANNOTATION_EXPORTERS = {
+    'bbox': _export_bbox,
+    'polygon': _export_points,
+    'keypoint': _export_points,
+}
+
+
+def _export_annotation(annotation: Dict, class_id: int, img_width: int, img_height: int) -> str:
+    """
+    Export single annotation as YOLO format string
     
-    @staticmethod
-    def export_annotation(annotation: Dict, class_id: int, img_width: int, img_height: int) -> str:
-        """
-        Export single annotation as YOLO format string
-        
-        Args:
-            annotation: Annotation data dictionary
-            class_id: Class ID
-            img_width, img_height: Image dimensions
-            
-        Returns:
-            YOLO format line: "class_id x y w h" or "class_id x1 y1 x2 y2 ..."
-        """
-        ann_type = annotation.get('type')
-        data = annotation.get('data')
-        
-        if isinstance(data, str):
-            data = json.loads(data)
+    Args:
+        annotation: Annotation data dictionary
+        class_id: Class ID
+        img_width, img_height: Image dimensions
         
-        if ann_type == 'bbox':
-            x_min = data['x_min']
-            y_min = data['y_min']
-            x_max = data['x_max']
-            y_max = data['y_max']
-            
-            yolo_x, yolo_y, yolo_w, yolo_h = YOLOExporter.normalize_bbox(
-                x_min, y_min, x_max, y_max, img_width, img_height
-            )
-            
-            return f"{class_id} {yolo_x} {yolo_y} {yolo_w} {yolo_h}"
-        
-        elif ann_type in ['polygon', 'keypoint']:
-            points = data.get('points', [])
-            normalized_points = YOLOExporter.normalize_points(points, img_width, img_height)
-            points_str = ' '.join(str(p) for p in normalized_points)
-            
-            return f"{class_id} {points_str}"
+    Returns:
+        YOLO format line: "class_id x y w h" or "class_id x1 y1 x2 y2 ..."
+    """
+    ann_type = annotation.get('type')
+    exporter = _ANNOTATION_EXPORTERS.get(ann_type)
+    if exporter is None:
+        raise ValueError(f"Unsupported annotation type: {ann_type}")
+    
+    data = annotation.get('data')
+    if isinstance(data, (str, bytes)):
+        data = json_loads(data)
+    
+    return exporter(data, class_id, img_width, img_height)
+
+
+def _export_image(image_id: int, annotations: List[Dict], class_map: Dict[str, int],
+                  img_width: int, img_height: int) -> List[str]:
+    """
+    Export all annotations for a single image
+    
+    Args:
+        image_id: Image ID
+        annotations: Annotation list
+        class_map: Mapping from class name to class ID
+        img_width, img_height: Image dimensions
         
-        else:
-            raise ValueError(f"Unsupported annotation type: {ann_type}")
+    Returns:
+        List of YOLO format lines
+    """
+    lines = []
+    # Boxes are normalized together after the loop: (line index, class_id, [x_min, y_min, x_max, y_max])
+    box_slots = []
+    batch_boxes = bool(img_width) and bool(img_height)
     
-    @staticmethod
-    def export_image(image_id: int, annotations: List[Dict], class_map: Dict[str, int],
-                    img_width: int, img_height: int) -> List[str]:
-        """
-        Export all annotations for a single image
+    # Local bindings for the per-annotation loop
+    get_class_id = class_map.get
+    export_annotation = _export_annotation
+    append_line = lines.append
+    
+    for ann in annotations:
+        class_id = get_class_id(ann.get('class_name'), -1)
         
-        Args:
-            image_id: Image ID
-            annotations: Annotation list
-            class_map: Mapping from class name to class ID
-            img_width, img_height: Image dimensions
-            
-        Returns:
-            List of YOLO format lines
-        """
-        lines = []
+        if class_id < 0:
+            continue
         
-        for ann in annotations:
-            class_name = ann.get('class_name')
-            class_id = class_map.get(class_name, -1)
-            
-            if class_id < 0:
+        try:
+            if batch_boxes and ann.get('type') == 'bbox':
+                data = ann.get('data')
+                if isinstance(data, (str, bytes)):
+                    data = json_loads(data)
+                coords = (float(data['x_min']), float(data['y_min']), float(data['x_max']), float(data['y_max']))
+                box_slots.append((len(lines), class_id, coords))
+                append_line(None)
                 continue
-            
-            try:
-                line = YOLOExporter.export_annotation(ann, class_id, img_width, img_height)
-                lines.append(line)
-            except Exception as e:
-                print(f"Error exporting annotation {ann.get('id')}: {e}")
-                continue
-        
-        return lines
+            append_line(export_annotation(ann, class_id, img_width, img_height))
+        except Exception as e:
+            print(f"Error exporting annotation {ann.get('id')}: {e}")
+            continue
+    
+    if box_slots:
+        if HAS_NUMPY and len(box_slots) >= VECTORIZE_MIN_COUNT:
+            boxes = np.array([coords for _, _, coords in box_slots], dtype=np.float64)
+            normalized = _normalize_bboxes(boxes, img_width, img_height).tolist()
+        else:
+            # Multiply by the inverse size, rounding is left to the 6 decimal line format
+            half_inv_w = 0.5 / img_width
+            half_inv_h = 0.5 / img_height
+            inv_w = 1.0 / img_width
+            inv_h = 1.0 / img_height
+            normalized = [
+                ((x_min + x_max) * half_inv_w, (y_min + y_max) * half_inv_h,
+                 (x_max - x_min) * inv_w, (y_max - y_min) * inv_h)
+                for _, _, (x_min, y_min, x_max, y_max) in box_slots
+            ]
+        line_format = BBOX_LINE_FORMAT
+        for (slot, class_id, _), box in zip(box_slots, normalized):
+            lines[slot] = line_format % (class_id, *box)
+    
+    return lines
+
+
+def _export_image_files(image: Dict, src_path: str, dst_path: str, label_path: Optional[str],
+                        class_map: Dict[str, int], copy_image: Callable[[str, str], None]) -> Optional[bytes]:
+    """
+    Copy one image into the export and write its label file (runs in an export worker thread)
+
+    Returns the label file content when label_path is None (labels are archived by the caller),
+    None when the image has no labels.
+    """
+    copy_image(src_path, dst_path)
+
+    # Export annotations
+    annotations = image.get('annotations', [])
+    if annotations:
+        label_lines = _export_image(
+            image['id'], annotations, class_map, image['width'], image['height']
+        )
+
+        if label_lines:
+            payload = _label_payload(label_lines)
+            if label_path is None:
+                return payload
+            _write_label_file(label_path, payload)
+    return None
+
+
+class YOLOExporter:
+    """YOLO format exporter"""
+    
+    # The conversion helpers are module functions (no class attribute lookups in the per-annotation loops)
+    normalize_bbox = staticmethod(_normalize_bbox)
+    normalize_bboxes = staticmethod(_normalize_bboxes)
+    normalize_points = staticmethod(_normalize_points)
+    normalize_points_flat = staticmethod(_normalize_points_flat)
+    export_annotation = staticmethod(_export_annotation)
+    export_image = staticmethod(_export_image)
     
     @staticmethod
-    def export_project(project_data: Dict, output_dir: Path, datasets_root: Path):
+    def export_project(project_data: Dict, output_dir: Path, datasets_root: Path, allow_hardlink: bool = True,
+                       labels_archive: bool = False):
         """
         Export entire project as YOLO format data (conforms to Ultralytics official format)
         
@@ -142,6 +413,10 @@ class YOLOExporter:
             project_data: Project data dictionary containing images, annotations, classes
             output_dir: Output directory
             datasets_root: Dataset root directory for parsing image paths
+            allow_hardlink: Hard link images instead of copying them when on the same filesystem
+                (exported images are only read, e.g. by training)
+            labels_archive: Pack the label files of each split into labels/<split>/labels.tar instead of
+                one file per image (for storage with expensive file creation; training reads label files)
         """
         # Clean old export directory to ensure clean directory structure
         if output_dir.exists():
@@ -165,13 +440,23 @@ class YOLOExporter:
         class_names = [cls['name'] for cls in classes]
         
         # Get all valid images (images with existing files)
+        # Each image directory is listed once instead of one stat() per image
         images = project_data.get('images', [])
+        project_root = os.path.join(datasets_root, project_data['id'])
+        dir_entries: Dict[str, set] = {}
+        # (image, source path, actual filename, label filename), paths derived once as plain strings
         valid_images = []
         
         for image in images:
-            src_path = datasets_root / project_data['id'] / image['path']
-            if src_path.exists():
-                valid_images.append(image)
+            src_path = os.path.join(project_root, image['path'])
+            image_dir, image_name = os.path.split(src_path)
+            entries = dir_entries.get(image_dir)
+            if entries is None:
+                entries = dir_entries[image_dir] = _list_dir(image_dir)
+            if image_name in entries:
+                # Use actual physical filename from path (not original filename)
+                # This ensures the source and destination filenames match
+                valid_images.append((image, src_path, image_name, os.path.splitext(image_name)[0] + ".txt"))
         
         # Determine split ratio: default 8:2, use 1:1 if image count is less than 10
         total_images = len(valid_images)
@@ -185,82 +470,69 @@ class YOLOExporter:
         val_count = total_images - train_count
         
         # Randomly shuffle image order (using fixed seed for reproducibility)
-        random.seed(42)  # Fixed seed to ensure consistent export results
-        shuffled_images = valid_images.copy()
-        random.shuffle(shuffled_images)
+        # Only an index permutation is shuffled (in compiled code with numpy), the global random state is untouched
+        if HAS_NUMPY:
+            order = np.random.default_rng(42).permutation(total_images).tolist()
+        else:
+            order = list(range(total_images))
+            random.Random(42).shuffle(order)
         
         # Split images
-        train_images = shuffled_images[:train_count]
-        val_images = shuffled_images[train_count:]
-        
-        # Export training set images and annotations
-        train_copied = 0
-        for image in train_images:
-            # Use actual physical filename from path (not original filename)
-            # This ensures the source and destination filenames match
-            actual_filename = Path(image['path']).name
-            img_stem = Path(actual_filename).stem
-            img_width = image['width']
-            img_height = image['height']
-
-            # Copy image file using actual filename
-            src_path = datasets_root / project_data['id'] / image['path']
-            dst_path = images_train_dir / actual_filename
-            shutil.copy2(src_path, dst_path)
-            train_copied += 1
-
-            # Export annotations
-            annotations = image.get('annotations', [])
-            if annotations:
-                label_lines = YOLOExporter.export_image(
-                    image['id'], annotations, class_map, img_width, img_height
-                )
-
-                if label_lines:
-                    label_file = labels_train_dir / f"{img_stem}.txt"
-                    with open(label_file, 'w', encoding='utf-8') as f:
-                        f.write('\n'.join(label_lines))
+        train_images = [valid_images[i] for i in order[:train_count]]
+        val_images = [valid_images[i] for i in order[train_count:]]
         
-        # Export validation set images and annotations
-        val_copied = 0
-        for image in val_images:
-            # Use actual physical filename from path (not original filename)
-            # This ensures the source and destination filenames match
-            actual_filename = Path(image['path']).name
-            img_stem = Path(actual_filename).stem
-            img_width = image['width']
-            img_height = image['height']
-
-            # Copy image file using actual filename
-            src_path = datasets_root / project_data['id'] / image['path']
-            dst_path = images_val_dir / actual_filename
-            shutil.copy2(src_path, dst_path)
-            val_copied += 1
-
-            # Export annotations
-            annotations = image.get('annotations', [])
-            if annotations:
-                label_lines = YOLOExporter.export_image(
-                    image['id'], annotations, class_map, img_width, img_height
-                )
-
-                if label_lines:
-                    label_file = labels_val_dir / f"{img_stem}.txt"
-                    with open(label_file, 'w', encoding='utf-8') as f:
-                        f.write('\n'.join(label_lines))
+        # Export training and validation set images and annotations
+        # One task per image (copy, label generation, label write) in a thread pool, so disk I/O of
+        # some images overlaps label generation of others
+        splits = [
+            (train_images, str(images_train_dir), str(labels_train_dir)),
+            (val_images, str(images_val_dir), str(labels_val_dir)),
+        ]
+        copy_image = _link_or_copy if allow_hardlink else _fast_copy
+        join = os.path.join
+        # (labels_dir, [(label filename, future), ...]) per split
+        split_jobs = []
+        with ThreadPoolExecutor(max_workers=EXPORT_IO_WORKERS) as executor:
+            for split_images, images_dir, labels_dir in splits:
+                jobs = []
+                for image, src_path, filename, label_name in split_images:
+                    label_path = None if labels_archive else join(labels_dir, label_name)
+                    jobs.append((label_name, executor.submit(
+                        _export_image_files, image, src_path, join(images_dir, filename),
+                        label_path, class_map, copy_image
+                    )))
+                split_jobs.append((labels_dir, jobs))
+
+            # Propagate the first copy/write error (archived labels are appended in image order as they complete)
+            for labels_dir, jobs in split_jobs:
+                if labels_archive:
+                    mtime = time.time()
+                    with tarfile.open(join(labels_dir, LABELS_ARCHIVE_NAME), 'w') as archive:
+                        for label_name, job in jobs:
+                            payload = job.result()
+                            if payload is not None:
+                                _add_to_archive(archive, label_name, payload, mtime)
+                else:
+                    for _, job in jobs:
+                        job.result()
+
+        train_copied = len(train_images)
+        val_copied = len(val_images)
         
         # Create data.yaml configuration file (Ultralytics standard format)
-        data_yaml = {
-            'path': str(output_dir.absolute()),  # Dataset root path
-            'train': 'images/train',  # Training images relative path
-            'val': 'images/val',  # Validation set path
-            'nc': len(classes),  # Number of classes
-            'names': class_names  # Class names list
-        }
+        # Fixed schema, so it is written from a template (same layout as yaml.dump with block style)
+        names_yaml = "".join(f"\n- {_yaml_scalar(name)}" for name in class_names) if class_names else " []"
+        data_yaml = (
+            f"path: {_yaml_scalar(str(output_dir.absolute()))}\n"  # Dataset root path
+            "train: images/train\n"  # Training images relative path
+            "val: images/val\n"  # Validation set path
+            f"nc: {len(classes)}\n"  # Number of classes
+            f"names:{names_yaml}\n"  # Class names list
+        )
         
         yaml_file = output_dir / "data.yaml"
         with open(yaml_file, 'w', encoding='utf-8') as f:
-            yaml.dump(data_yaml, f, default_flow_style=False, allow_unicode=True, sort_keys=False)
+            f.write(data_yaml)
         
         # Create class names file (compatible with old format)
         names_file = output_dir / "classes.txt"
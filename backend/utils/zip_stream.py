@@ -0,0 +1,220 @@
+"""Streaming ZIP archive tool"""
+import os
+import stat
+import struct
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Tuple, Union
+
+# Number of upcoming files the kernel is asked to read ahead while the current one is compressed
+ZIP_STREAM_PREFETCH_DEPTH = 32
+
+# Number of entries read and compressed in parallel (zlib releases the GIL)
+ZIP_STREAM_WORKERS = os.cpu_count() or 1
+
+# Entropy-coded formats that deflate can't shrink; stored as-is to save CPU
+STORED_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.webp', '.gif', '.zip', '.gz'})
+
+# (arcname, source) where source is a file path or in-memory content
+ZipEntry = Tuple[str, Union[Path, bytes, str]]
+
+# Size/offset/count limits above which zip64 records are required (same limits as zipfile)
+_ZIP64_LIMIT = (1 << 31) - 1
+_ZIP_FILECOUNT_LIMIT = (1 << 16) - 1
+
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+_END_RECORD = struct.Struct("<4s4H2LH")
+_END_RECORD64 = struct.Struct("<4sQ2H2L4Q")
+_END_LOCATOR64 = struct.Struct("<4sLQL")
+
+
+def _prefetch_file(path: Path):
+    """Ask the kernel to start reading a file into the page cache (no-op where unsupported)"""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def _iter_with_prefetch(entries: Iterable[ZipEntry], depth: int) -> Iterator[ZipEntry]:
+    """Yield entries unchanged while keeping read-ahead hints issued for the next `depth` files"""
+    window = deque()
+    for entry in entries:
+        if isinstance(entry[1], Path):
+            _prefetch_file(entry[1])
+        window.append(entry)
+        if len(window) > depth:
+            yield window.popleft()
+    while window:
+        yield window.popleft()
+
+
+def _dos_datetime(timestamp: float) -> Tuple[int, int]:
+    """Convert a POSIX timestamp to (dos_time, dos_date)"""
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def _entry_compression(arcname: str, compression: int) -> int:
+    """Compression method for one member: already-compressed files are stored"""
+    if compression == zipfile.ZIP_DEFLATED and os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return compression
+
+
+def _load_entry(arcname: str, source: Union[Path, bytes, str], compression: int) -> Dict:
+    """Read and compress one archive member (runs in a worker thread)"""
+    if isinstance(source, Path):
+        st = source.stat()
+        raw = source.read_bytes()
+        mtime, mode = st.st_mtime, st.st_mode
+    else:
+        raw = source.encode("utf-8") if isinstance(source, str) else source
+        mtime, mode = time.time(), stat.S_IFREG | 0o644
+
+    if compression == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        data = compressor.compress(raw) + compressor.flush()
+    elif compression == zipfile.ZIP_STORED:
+        data = raw
+    else:
+        raise ValueError(f"Unsupported compression method: {compression}")
+
+    try:
+        name = arcname.encode("ascii")
+        flags = 0
+    except UnicodeEncodeError:
+        name = arcname.encode("utf-8")
+        flags = 0x800
+
+    dos_time, dos_date = _dos_datetime(mtime)
+    return {
+        "name": name,
+        "flags": flags,
+        "compression": compression,
+        "dos_time": dos_time,
+        "dos_date": dos_date,
+        "crc": zlib.crc32(raw),
+        "file_size": len(raw),
+        "compress_size": len(data),
+        "external_attr": (mode & 0xFFFF) << 16,
+        "data": data,
+        "offset": 0,
+    }
+
+
+def _local_header(member: Dict) -> bytes:
+    """Build the local file header for a member"""
+    file_size, compress_size = member["file_size"], member["compress_size"]
+    extra = b""
+    version = 20
+    if file_size > _ZIP64_LIMIT or compress_size > _ZIP64_LIMIT:
+        extra = struct.pack("<HHQQ", 1, 16, file_size, compress_size)
+        file_size = compress_size = 0xFFFFFFFF
+        version = 45
+    header = _LOCAL_HEADER.pack(
+        b"PK\003\004", version, 0, member["flags"], member["compression"],
+        member["dos_time"], member["dos_date"], member["crc"],
+        compress_size, file_size, len(member["name"]), len(extra)
+    )
+    return header + member["name"] + extra
+
+
+def _central_header(member: Dict) -> bytes:
+    """Build the central directory header for a member"""
+    fields = []
+    file_size, compress_size, offset = member["file_size"], member["compress_size"], member["offset"]
+    if file_size > _ZIP64_LIMIT:
+        fields.append(file_size)
+        file_size = 0xFFFFFFFF
+    if compress_size > _ZIP64_LIMIT:
+        fields.append(compress_size)
+        compress_size = 0xFFFFFFFF
+    if offset > _ZIP64_LIMIT:
+        fields.append(offset)
+        offset = 0xFFFFFFFF
+    extra = struct.pack(f"<HH{len(fields)}Q", 1, 8 * len(fields), *fields) if fields else b""
+    version = 45 if fields else 20
+    header = _CENTRAL_HEADER.pack(
+        b"PK\001\002", version, 3, version, 0, member["flags"], member["compression"],
+        member["dos_time"], member["dos_date"], member["crc"],
+        compress_size, file_size, len(member["name"]), len(extra), 0, 0, 0,
+        member["external_attr"], offset
+    )
+    return header + member["name"] + extra
+
+
+def _end_records(count: int, cd_offset: int, cd_size: int) -> bytes:
+    """Build the end of central directory records (with zip64 records when needed)"""
+    records = b""
+    if count > _ZIP_FILECOUNT_LIMIT or cd_offset > _ZIP64_LIMIT or cd_size > _ZIP64_LIMIT:
+        zip64_offset = cd_offset + cd_size
+        records += _END_RECORD64.pack(b"PK\006\006", 44, 45, 45, 0, 0, count, count, cd_size, cd_offset)
+        records += _END_LOCATOR64.pack(b"PK\006\007", 0, zip64_offset, 1)
+        count = min(count, 0xFFFF)
+        cd_offset = min(cd_offset, 0xFFFFFFFF)
+        cd_size = min(cd_size, 0xFFFFFFFF)
+    return records + _END_RECORD.pack(b"PK\005\006", 0, 0, count, count, cd_size, cd_offset, 0)
+
+
+def stream_zip(entries: Iterable[ZipEntry], compression: int = zipfile.ZIP_DEFLATED) -> Iterator[bytes]:
+    """
+    Build a ZIP archive on the fly and yield its bytes as they are produced
+
+    Nothing is written to disk. Entries are read and deflated in parallel by a
+    bounded thread pool and written in their original order, so memory stays at
+    a few members and every core takes part in compression. Reads of upcoming
+    files are hinted to the kernel so disk I/O overlaps compression.
+
+    Args:
+        entries: (arcname, source) pairs, source is a file Path or bytes/str content
+        compression: zipfile compression method (ZIP_DEFLATED or ZIP_STORED);
+            members with an extension in STORED_EXTENSIONS are always stored
+
+    Yields:
+        Consecutive chunks of the archive (suitable for StreamingResponse)
+    """
+    members = []
+    offset = 0
+    window = ZIP_STREAM_WORKERS * 2
+
+    with ThreadPoolExecutor(max_workers=ZIP_STREAM_WORKERS) as pool:
+        pending = deque()
+        entry_iter = _iter_with_prefetch(entries, ZIP_STREAM_PREFETCH_DEPTH)
+        while True:
+            # Keep the pool busy with the next few entries
+            for arcname, source in entry_iter:
+                pending.append(pool.submit(_load_entry, arcname, source, _entry_compression(arcname, compression)))
+                if len(pending) >= window:
+                    break
+            if not pending:
+                break
+
+            member = pending.popleft().result()
+            member["offset"] = offset
+            header = _local_header(member)
+            data = member.pop("data")
+            offset += len(header) + len(data)
+            members.append(member)
+            yield header
+            if data:
+                yield data
+
+    central_directory = b"".join(_central_header(member) for member in members)
+    yield central_directory
+    yield _end_records(len(members), offset, len(central_directory))
@@ -30,9 +30,13 @@ export const useWebSocket = (
 
     ws.onmessage = (event) => {
       try {
-        const message = JSON.parse(event.data);
-        console.log('[WebSocket] Message received:', message);
-        onMessageRef.current(message);
+        const data = JSON.parse(event.data);
+        // Updates issued together are delivered as one array frame
+        const messages = Array.isArray(data) ? data : [data];
+        for (const message of messages) {
+          console.log('[WebSocket] Message received:', message);
+          onMessageRef.current(message);
+        }
       } catch (error) {
         console.error('[WebSocket] Failed to parse message:', error, event.data);
       }